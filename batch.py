@@ -0,0 +1,190 @@
+from argparse import ArgumentParser
+from ast import literal_eval
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from csv import DictReader
+from itertools import islice
+from json import dumps, loads
+from os import cpu_count
+from sys import stdin, stdout
+from typing import Iterable, Iterator, TextIO
+
+from config_init import CONFIG as DEFAULT_CONFIG
+from optimizer import Optimizer, Profile
+
+
+# The field of a record that is passed on to its result instead of the config
+ID_FIELD = "id"
+
+
+def parse_csv_value(text: str):
+    """
+    Parse a CSV cell as a Python literal like in config.py, or keep it as text if it is not one.
+
+    @text: The text of the cell.
+    """
+    try:
+        return literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def read_records(file: TextIO, file_format: str) -> Iterator[dict]:
+    """
+    Read the records of a JSONL or CSV file one by one.
+
+    The empty lines of JSONL and the empty cells of CSV are skipped,
+    so the defaults are used for the missing fields.
+
+    @file: The opened input file.
+    @file_format: Either "jsonl" or "csv".
+    """
+    if file_format == "jsonl":
+        for line in file:
+            if line.strip():
+                yield loads(line)
+    elif file_format == "csv":
+        for row in DictReader(file):
+            yield {key: parse_csv_value(value) for key, value in row.items() if value != ""}
+    else:
+        raise ValueError(f"unknown batch file format: {file_format!r}")
+
+
+def to_config(record: dict) -> dict:
+    """
+    Get the config of a record on top of the defaults of config_init.py, checked by the Profile.
+
+    @record: The config fields of the record, with an optional id field.
+    """
+    unknown = [key for key in record if key not in DEFAULT_CONFIG and key != ID_FIELD]
+    if len(unknown) > 0:
+        raise ValueError(f"unknown config fields: {unknown}")
+    config = {**DEFAULT_CONFIG, **record}
+    config.pop(ID_FIELD, None)
+    Profile(config)
+    return config
+
+
+def optimize_config(config: dict, lazy: bool = False, bulk: bool = False,
+                    exact: bool = False) -> dict:
+    """
+    Optimize a config and get the result as a JSON object, without the ranked trees
+    since every result would hold all the trees of its search.
+
+    @config: The checked config.
+    @lazy: Whether to use the lazy greedy purchases.
+    @bulk: Whether to use the bulk greedy purchases.
+    @exact: Whether to search for the best levels instead of the greedy purchases.
+    """
+    # The batch is already spread over the processes, so the tree search stays in this one
+    result = Optimizer(config).optimize(lazy=lazy, bulk=bulk, exact=exact, workers=1).to_dict()
+    del result["trees"]
+    return result
+
+
+def _optimize_chunk(chunk: list[tuple[dict, dict | None]], options: dict) -> list[dict]:
+    results = []
+    for result, config in chunk:
+        if config is not None:
+            try:
+                result.update(optimize_config(config, **options))
+            except Exception as error:  # One failed profile is reported instead of the batch
+                result["error"] = f"{type(error).__name__}: {error}"
+        results.append(result)
+    return results
+
+
+def optimize_records(records: Iterable[dict], workers: int | None = None,
+                     chunksize: int = 16, ordered: bool = True,
+                     **options) -> Iterator[dict]:
+    """
+    Optimize the records in chunks over a process pool and yield the results as they finish.
+
+    Only a few chunks for each worker are read ahead of the results, so the memory stays bounded
+    for any number of records. The records that fail the config checks are not optimized,
+    and their results hold the error instead.
+
+    @records: The config fields of each profile, with an optional id field.
+    @workers: Number of worker processes, defaults to the CPU count.
+    @chunksize: Number of records sent to a worker at once.
+    @ordered: Whether to yield the results in the order of the records instead of as they finish.
+    @options: The lazy, bulk and exact options of the allocation.
+    """
+    def get_chunks() -> Iterator[list[tuple[dict, dict | None]]]:
+        indexed = enumerate(records)
+        while True:
+            chunk = []
+            for index, record in islice(indexed, chunksize):
+                result = {"index": index}
+                if isinstance(record, dict) and ID_FIELD in record:
+                    result[ID_FIELD] = record[ID_FIELD]
+                try:
+                    if not isinstance(record, dict):
+                        raise ValueError(f"record is not an object: {record!r}")
+                    config = to_config(record)
+                except (KeyError, ValueError, TypeError) as error:
+                    result["error"] = f"{type(error).__name__}: {error}"
+                    config = None
+                chunk.append((result, config))
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+    workers = workers or cpu_count() or 1
+    chunks = get_chunks()
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for chunk in islice(chunks, 2 * workers):
+            pending.append(executor.submit(_optimize_chunk, chunk, options))
+        while len(pending) > 0:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+            for future in done:
+                for chunk in islice(chunks, 1):
+                    pending.append(executor.submit(_optimize_chunk, chunk, options))
+                yield from future.result()
+
+
+def main():
+    parser = ArgumentParser(description="Optimize every profile of a JSONL or CSV file,"
+                                        " each on top of the config_init.py defaults,"
+                                        " and write the results as JSONL.")
+    parser.add_argument("input", help="the JSONL or CSV file of profiles, or - for stdin")
+    parser.add_argument("-o", "--output", help="the JSONL file of results, stdout if not given")
+    parser.add_argument("-f", "--format", choices=("jsonl", "csv"),
+                        help="the input format, found from the file extension if not given")
+    parser.add_argument("-w", "--workers", type=int, help="the number of worker processes")
+    parser.add_argument("-c", "--chunksize", type=int, default=16,
+                        help="the number of profiles sent to a worker at once")
+    parser.add_argument("-u", "--unordered", action="store_true",
+                        help="write the results as they finish instead of in the input order")
+    method = parser.add_mutually_exclusive_group()
+    method.add_argument("--lazy", action="store_true", help="use the lazy greedy purchases")
+    method.add_argument("--bulk", action="store_true", help="use the bulk greedy purchases")
+    method.add_argument("--exact", action="store_true", help="search for the best levels")
+    args = parser.parse_args()
+
+    file_format = args.format
+    if file_format is None:
+        file_format = "csv" if args.input.lower().endswith(".csv") else "jsonl"
+    input_file = stdin if args.input == "-" else open(args.input, newline="")
+    output_file = stdout if args.output is None else open(args.output, "w")
+    try:
+        results = optimize_records(
+            read_records(input_file, file_format), args.workers, args.chunksize,
+            not args.unordered, lazy=args.lazy, bulk=args.bulk, exact=args.exact)
+        for result in results:
+            output_file.write(dumps(result) + "\n")
+    finally:
+        if input_file is not stdin:
+            input_file.close()
+        if output_file is not stdout:
+            output_file.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+from argparse import ArgumentParser
+from json import dump, load
+from os.path import dirname, join
+from platform import platform, python_version
+from random import Random
+from statistics import median
+from subprocess import run
+from sys import executable
+from time import perf_counter
+
+from config import CONFIG
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+ROOT_DIR = dirname(__file__)
+BASELINE_PATH = join(ROOT_DIR, "bench_baseline.json")
+
+# Every mode with each ore or powder type that it takes
+TASKS = {
+    **{f"ores-{ore}": dict(mode="ores", ore=ore, use_titanium=ore == "titanium")
+       for ore in ("ore", "mithril", "titanium", "glacite",
+                   "ruby", "amber", "topaz", "jasper", "aquamarine")},
+    **{f"exp-{ore}": dict(mode="exp", ore=ore, use_titanium=ore == "titanium")
+       for ore in ("ore", "mithril", "titanium", "glacite",
+                   "ruby", "amber", "topaz", "jasper", "aquamarine")},
+    "powder-mithril": dict(mode="powder", powder_type="mithril", use_titanium=False),
+    "powder-mithril-titanium": dict(mode="powder", powder_type="mithril", use_titanium=True),
+    "powder-gemstone": dict(mode="powder", powder_type="gemstone", use_titanium=False),
+    "powder-glacite": dict(mode="powder", powder_type="glacite", use_titanium=False),
+}
+# The mithril, gemstone and glacite powder of a player at each HOTM level,
+# and the powder to max the tree
+POWDERS = {
+    "low": lambda hotm: (5000 * hotm ** 2, 5000 * hotm ** 2, 1000 * hotm ** 2),
+    "high": lambda hotm: (3_000_000, 20_000_000, 500_000),
+}
+
+
+def get_corpus(hotm_levels=range(1, 11)) -> dict[str, dict]:
+    """
+    Get the profiles to benchmark by name, for every task at each HOTM level with
+    low and high powder, all with the stats of config.py and the tree searched.
+
+    @hotm_levels: The HOTM levels of the profiles.
+    """
+    corpus = {}
+    for task_name, task in TASKS.items():
+        for hotm in hotm_levels:
+            for powder_name, get_powders in POWDERS.items():
+                mithril_powder, gemstone_powder, glacite_powder = get_powders(hotm)
+                corpus[f"{task_name}/hotm{hotm}/{powder_name}"] = {
+                    **CONFIG, "powder_type": None, **task,
+                    "heart_of_the_mountain": hotm, "core_of_the_mountain": hotm,
+                    "mithril_powder": mithril_powder, "gemstone_powder": gemstone_powder,
+                    "glacite_powder": glacite_powder, "given_tree": None,
+                    "target_amount": None, "force_ability": None,
+                }
+    return corpus
+
+
+def time_call(func, repeat: int, min_seconds: float = 0.2) -> dict:
+    """
+    Time the calls of a function and get the median and fastest seconds of a call.
+
+    The fast functions are called more times until the calls take the minimum seconds,
+    since the fastest of many calls is less affected by the other load of the machine.
+
+    @func: The function without arguments to call.
+    @repeat: Least number of calls to time.
+    @min_seconds: Least total seconds of the calls to time.
+    """
+    times = []
+    total = 0
+    while len(times) < repeat or (total < min_seconds and len(times) < 1000):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+        total += times[-1]
+    return {"seconds": median(times), "min": min(times), "runs": len(times)}
+
+
+def time_process(code: str, repeat: int) -> dict:
+    """
+    Time running the code in a new interpreter, less the time of starting an empty one.
+
+    @code: The Python code to run from the project folder.
+    @repeat: Number of runs to time of each.
+    """
+    def get_times(code: str) -> list[float]:
+        times = []
+        for _ in range(repeat):
+            start = perf_counter()
+            run([executable, "-c", code], cwd=ROOT_DIR, check=True)
+            times.append(perf_counter() - start)
+        return times
+
+    base = min(get_times("pass"))
+    times = [max(0, time - base) for time in get_times(code)]
+    return {"seconds": median(times), "min": min(times), "runs": len(times)}
+
+
+def bench_data(repeat: int) -> dict[str, dict]:
+    from data import build_bundle
+
+    return {
+        "import/data": time_process("import data; data.NODE_NAMES", repeat),
+        "import/optimizer": time_process("import optimizer", repeat),
+        "data/build_bundle": time_call(build_bundle, repeat),
+    }
+
+
+def bench_paths(repeat: int) -> dict[str, dict]:
+    import pathfind
+    from data import HOTM_TAKEN
+
+    initial = {**pathfind.PATHS}
+
+    def build():
+        pathfind.PATHS.clear()
+        pathfind.PATHS.update(initial)
+        for node in range(len(HOTM_TAKEN)):
+            pathfind.get_paths(node)
+
+    return {"pathfind/paths": time_call(build, repeat)}
+
+
+def bench_eval(repeat: int, count: int = 1000) -> dict[str, dict]:
+    """
+    Time scoring random levels of the config tree for each task, one at a time and in a batch.
+
+    @repeat: Number of times to time each task.
+    @count: Number of level allocations scored each time.
+    """
+    from collections import defaultdict
+
+    from data import NODE_LEVEL_DELTAS, NODE_MAX_LEVELS, to_id
+    from optimizer import Profile
+
+    results = {}
+    tree = [to_id(name) for name in CONFIG["given_tree"]]
+    nodes = [node for node in tree if NODE_LEVEL_DELTAS[node] is not None]
+    others = [node for node in tree if node not in nodes]
+    rng = Random(20)
+    rows = [[rng.randint(1, NODE_MAX_LEVELS[node]) for node in nodes] + [1] * len(others)
+            for _ in range(count)]
+    all_levels = [defaultdict(int, zip(nodes + others, row)) for row in rows]
+    for task_name, task in TASKS.items():
+        try:
+            profile = Profile({**CONFIG, "powder_type": None, **task})
+        except ValueError as error:
+            results[f"eval/{task_name}"] = {"error": f"{type(error).__name__}: {error}"}
+            continue
+
+        def eval_all():
+            for levels in all_levels:
+                profile.eval(levels)
+
+        def eval_batch():
+            profile.eval_batch(nodes + others, rows)
+
+        for name, func in (("eval", eval_all), ("eval_batch", eval_batch)):
+            try:
+                result = time_call(func, repeat)
+            except Exception as error:  # A broken task is recorded instead of stopping the suite
+                results[f"{name}/{task_name}"] = {"error": f"{type(error).__name__}: {error}"}
+                continue
+            result["per_second"] = count / result["seconds"]
+            results[f"{name}/{task_name}"] = result
+    return results
+
+
+def bench_optimize(corpus: dict[str, dict], repeat: int) -> dict[str, dict]:
+    """
+    Time the tree search and the end to end optimization of each profile in this process.
+
+    @corpus: The profiles by name.
+    @repeat: Number of times to time each profile.
+    """
+    from optimizer import Optimizer
+    from pathfind import clear_steiner_caches
+
+    results = {}
+    for name, config in corpus.items():
+        # The Steiner searches of the earlier runs and profiles are cleared in each call,
+        # so the times do not depend on which profiles ran before
+        def find_trees():
+            clear_steiner_caches()
+            Optimizer(config).find_trees(workers=1)
+
+        result = None
+
+        def optimize():
+            nonlocal result
+            clear_steiner_caches()
+            result = Optimizer(config).optimize(workers=1)
+
+        try:
+            results[f"find_trees/{name}"] = time_call(find_trees, repeat)
+            results[f"optimize/{name}"] = time_call(optimize, repeat)
+            results[f"optimize/{name}"]["score"] = result.score
+        except Exception as error:  # A broken profile is recorded instead of stopping the suite
+            results[f"optimize/{name}"] = {"error": f"{type(error).__name__}: {error}"}
+    return results
+
+
+def bench_lazy(corpus: dict[str, dict]) -> dict:
+    """
+    Compare the lazy greedy purchases with the exhaustive ones on the best searched tree
+    of each profile, and get whether the levels match and the score lost by each profile,
+    with the count of the matches.
+
+    @corpus: The profiles by name.
+    """
+    from optimizer import Optimizer
+
+    profiles = {}
+    for name, config in corpus.items():
+        try:
+            # The lazy optimization reuses the tree search of the exhaustive one
+            optimizer = Optimizer(config)
+            exhaustive = optimizer.optimize(workers=1)
+            lazy = optimizer.optimize(lazy=True, workers=1)
+        except Exception as error:  # A broken profile is recorded instead of stopping the suite
+            profiles[name] = {"error": f"{type(error).__name__}: {error}"}
+            continue
+        profiles[name] = {"match": lazy.levels == exhaustive.levels,
+                          "score": lazy.score, "exhaustive_score": exhaustive.score,
+                          "delta": exhaustive.score - lazy.score}
+    compared = [result for result in profiles.values() if "error" not in result]
+    return {"matches": sum(result["match"] for result in compared),
+            "compared": len(compared), "profiles": profiles}
+
+
+def compare_lazy(lazy: dict, baseline: dict) -> list[str]:
+    """
+    Print how the lazy greedy matches changed from the baseline and get the names
+    of the profiles that no longer match or lose more score than in the baseline.
+
+    @lazy: The lazy greedy comparison.
+    @baseline: The lazy greedy comparison of the baseline.
+    """
+    regressions = []
+    for name, result in lazy["profiles"].items():
+        base = baseline["profiles"].get(name)
+        if base is None or "error" in result or "error" in base:
+            continue
+        if base["match"] and not result["match"] or result["delta"] > base["delta"]:
+            print(f"lazy/{name}: score lost {base['delta']} -> {result['delta']}")
+            regressions.append(f"lazy/{name}")
+    print(f"lazy: {baseline['matches']}/{baseline['compared']} matches"
+          f" -> {lazy['matches']}/{lazy['compared']}")
+    return regressions
+
+
+def bench_service(corpus: dict[str, dict]) -> dict:
+    """
+    Send the service two HTTP requests at once for an ores profile that differ only in the
+    mining wisdom, which the mode does not use, and get its request counts,
+    where the second request should wait for the result of the first.
+
+    @corpus: The profiles by name, the first ores profile of which is sent.
+    """
+    from asyncio import gather, open_connection, run
+    from json import dumps
+    from service import OptimizeService
+
+    record = next(config for name, config in corpus.items() if name.startswith("ores-"))
+
+    async def post(port: int, body: dict) -> bytes:
+        reader, writer = await open_connection("127.0.0.1", port)
+        data = dumps(body).encode()
+        writer.write(f"POST /optimize HTTP/1.1\r\nContent-Length: {len(data)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + data)
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def send():
+        service = OptimizeService(workers=1)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            await gather(*(post(port, {"config": {**record, "mining_wisdom": wisdom}})
+                           for wisdom in (0, 100)))
+        finally:
+            server.close()
+            service.close()
+        return service.get_stats()
+
+    return run(send())
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict],
+            threshold: float) -> list[str]:
+    """
+    Print how each benchmark changed from the baseline and get the names of the regressions,
+    which are the ones slower by more than the threshold or with a different score or error.
+
+    The fastest calls are compared, which vary less between runs than the medians.
+
+    @results: The benchmarks by name.
+    @baseline: The benchmarks of the baseline by name.
+    @threshold: The fraction of the baseline time that a benchmark can be slower by.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name}: new")
+            continue
+        base = baseline[name]
+        if "error" in result or "error" in base:
+            if result.get("error") != base.get("error"):
+                print(f"{name}: error {base.get('error')} -> {result.get('error')}")
+                regressions.append(name)
+            continue
+        ratio = result["min"] / base["min"] if base["min"] > 0 else 1
+        note = ""
+        if ratio > 1 + threshold:
+            note = "  SLOWER"
+            regressions.append(name)
+        if "score" in base and result.get("score") != base["score"]:
+            note += f"  score {base['score']} -> {result.get('score')}"
+            if name not in regressions:
+                regressions.append(name)
+        print(f"{name}: {base['min'] * 1000:.3f}ms -> {result['min'] * 1000:.3f}ms"
+              f" ({ratio:.2f}x){note}")
+    for name in baseline:
+        if name not in results:
+            print(f"{name}: missing")
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the data import, the pathfinding,"
+                                        " the evaluation and the optimization.")
+    parser.add_argument("-o", "--output", default=join(ROOT_DIR, "bench_results.json"),
+                        help="the JSON file to write the results to")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="the number of times to time each benchmark")
+    parser.add_argument("--hotm", type=int, nargs="+", default=[*range(1, 11)],
+                        help="the HOTM levels of the profiles to optimize")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="also write the results as the baseline")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH,
+                        help="the baseline to compare with, bench_baseline.json if not given")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="the fraction slower than the baseline that counts as a regression")
+    args = parser.parse_args()
+
+    benchmarks = {}
+    benchmarks.update(bench_data(args.repeat))
+    benchmarks.update(bench_paths(args.repeat))
+    benchmarks.update(bench_eval(args.repeat))
+    corpus = get_corpus(args.hotm)
+    # The optimizations take the longest, so the slow ones are timed fewer times
+    benchmarks.update(bench_optimize(corpus, max(1, args.repeat // 5)))
+    results = {
+        "meta": {"python": python_version(), "platform": platform(),
+                 "numpy": None if np is None else np.__version__, "repeat": args.repeat},
+        "benchmarks": benchmarks,
+        "lazy": bench_lazy(corpus),
+        "service": bench_service(corpus),
+    }
+
+    with open(args.output, "w") as file:
+        dump(results, file, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as file:
+            dump(results, file, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = load(file)
+        regressions = compare(benchmarks, baseline["benchmarks"], args.threshold)
+        if "lazy" in baseline:
+            regressions += compare_lazy(results["lazy"], baseline["lazy"])
+        service = results["service"]
+        print(f"service: {service['coalesced']} of {service['requests']} requests coalesced")
+        # Requests that differ only in unused config fields should never be optimized twice
+        if service["optimizations"] != 1:
+            regressions.append("service/coalesced")
+        print(f"{len(regressions)} regressions over {args.threshold:.0%} or with other results")
+        if len(regressions) > 0:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
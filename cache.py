@@ -0,0 +1,132 @@
+from marshal import dump, load
+from os import getpid, listdir, makedirs, remove, replace, stat, utime
+from os.path import dirname, join
+
+
+# The results are kept next to the code, not in the working directory
+CACHE_DIR = join(dirname(__file__), "cache")
+CACHE_SUFFIX = ".marshal"
+
+__all__ = ["CACHE_DIR", "ResultCache", "get_key"]
+
+
+def get_key(fingerprint) -> str:
+    """
+    Get the cache key of a fingerprint as the hash of its canonical text.
+
+    @fingerprint: The nested tuples of numbers, strings and booleans that the result depends on.
+    """
+    # Only imported when the cache is used, since importing hashlib is slower than loading the data
+    from hashlib import sha256
+
+    return sha256(repr(fingerprint).encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Results stored as one file for each key in a folder, with the least recently used
+    files removed when the total size goes over the cap.
+
+    The modification time of a file is its last use, so the order is shared between runs
+    and the processes using the same folder.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = 1 << 22):
+        """
+        @cache_dir: The folder of the result files, created when the first result is stored.
+        @max_bytes: The total size of the result files to keep.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_path(self, key: str) -> str:
+        return join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def get(self, key: str):
+        """
+        Get the result stored for the key, or None if there is none.
+
+        @key: The key from get_key.
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as file:
+                result = load(file)
+        except (OSError, EOFError, ValueError, TypeError):  # A missing or broken file is a miss
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            # Mark the file as just used
+            utime(path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key: str, result):
+        """
+        Store the result for the key and evict the least recently used results over the cap,
+        or skip it if the folder is read-only.
+
+        @key: The key from get_key.
+        @result: The result of values that marshal can store.
+        """
+        path = self.get_path(key)
+        # Write to a file of the process first so parallel runs never read half a result
+        temp_path = f"{path}.{getpid()}.tmp"
+        try:
+            makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, "wb") as file:
+                dump(result, file)
+            replace(temp_path, path)
+        except OSError:
+            try:
+                remove(temp_path)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used results until the total size is within the cap.
+        """
+        entries = []
+        for file_name in listdir(self.cache_dir):
+            if not file_name.endswith(CACHE_SUFFIX):
+                continue
+            path = join(self.cache_dir, file_name)
+            try:
+                file_stat = stat(path)
+            except OSError:  # Removed by another process
+                continue
+            entries.append((file_stat.st_mtime_ns, file_stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Remove every stored result.
+        """
+        try:
+            file_names = listdir(self.cache_dir)
+        except OSError:
+            return
+        for file_name in file_names:
+            if file_name.endswith(CACHE_SUFFIX):
+                try:
+                    remove(join(self.cache_dir, file_name))
+                except OSError:
+                    pass
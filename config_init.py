@@ -174,10 +174,9 @@ CONFIG = {
     # * Forces ability if specified.
     # ! Abilities are ignored for the rates optimization.
     # ! Will be supported in the future.
-    # ! Auto tree is also not supported yet, so a given tree
-    # ! should be provided below to start the optimization.
     "force_ability": None,
     # * Uses the tree if given, data should be an iterable with the node names.
+    # ? Set to None to search for the best tree with your HOTM level and tokens.
     "given_tree": (
         "mining_speed",
     ),
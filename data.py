@@ -1,48 +1,35 @@
-from json import load
-from pathlib import Path as pathtype
-
-
-DATA_DIR = pathtype("data")
-
-with open(DATA_DIR / "abilities.json") as file:
-    ABILITIES = load(file)
-with open(DATA_DIR / "blocks.json") as file:
-    BLOCKS = load(file)
-with open(DATA_DIR / "compact_chances.json") as file:
-    COMPACT_CHANCES = load(file)
-with open(DATA_DIR / "hotm_perks.json") as file:
-    HOTM_PERKS = load(file)
-with open(DATA_DIR / "hotm_powder_exponent.json") as file:
-    HOTM_POWDER_EXPONENT = load(file)
-with open(DATA_DIR / "hotm_powder_level_pad.json") as file:
-    HOTM_POWDER_LEVEL_PAD = load(file)
-with open(DATA_DIR / "hotm_tree.json") as file:
-    HOTM_TREE = load(file)
-with open(DATA_DIR / "powder_types.json") as file:
-    POWDER_TYPES = load(file)
-with open(DATA_DIR / "task_stats.json") as file:
-    TASK_STATS = load(file)
-with open(DATA_DIR / "tokens_hotm.json") as file:
-    TOKENS_HOTM = load(file)
-with open(DATA_DIR / "tokens_cotm.json") as file:
-    TOKENS_COTM = load(file)
-
-NODE_NAMES = []
-NODE_POSITIONS = {}
-for i, row in enumerate(HOTM_TREE):
-    for j, name in enumerate(row):
-        if name is not None:
-            NODE_NAMES.append(name)
-            NODE_POSITIONS[name] = (i, j)
-
-HOTM_BOOL = [[item is not None for item in row] for row in HOTM_TREE]
-HOTM_TAKEN = [(i, j) for i, row in enumerate(HOTM_BOOL)
-              for j, item in enumerate(row) if item]
-
-BLOCK_MAP = {}
-for block in BLOCKS:
-    BLOCK_MAP[block["name"]] = {key: value for key, value in block.items()
-                                if key != "name"}
+from marshal import dump, load as load_marshal, version as marshal_version
+from os import getpid, remove, replace, stat
+from os.path import dirname, join
+from types import MappingProxyType
+
+
+# The data files are found from this module, not the working directory
+DATA_DIR = join(dirname(__file__), "data")
+BUNDLE_PATH = join(DATA_DIR, "bundle.marshal")
+
+DATA_FILES = {
+    "ABILITIES": "abilities.json",
+    "BLOCKS": "blocks.json",
+    "COMPACT_CHANCES": "compact_chances.json",
+    "HOTM_PERKS": "hotm_perks.json",
+    "HOTM_POWDER_EXPONENT": "hotm_powder_exponent.json",
+    "HOTM_POWDER_LEVEL_PAD": "hotm_powder_level_pad.json",
+    "HOTM_TREE": "hotm_tree.json",
+    "POWDER_TYPES": "powder_types.json",
+    "TASK_STATS": "task_stats.json",
+    "TOKENS_HOTM": "tokens_hotm.json",
+    "TOKENS_COTM": "tokens_cotm.json",
+}
+# The tables in the bundle, which are loaded when any of them is first used
+BUNDLE_NAMES = (
+    *DATA_FILES, "NODE_NAMES", "NODE_POSITIONS", "HOTM_BOOL", "HOTM_TAKEN", "BLOCK_MAP",
+    "MAX_LEVELS", "TOTAL_COSTS", "LEVEL_DELTAS", "STAT_NAMES", "NODE_STATS",
+    "NODE_IDS", "NODE_PERKS", "NODE_COST_TYPES", "NODE_MAX_LEVELS", "NODE_TOTAL_COSTS",
+    "NODE_LEVEL_DELTAS", "STAT_IDS", "NODE_STAT_INITS", "NODE_STAT_DELTAS", "NODE_STAT_COLUMNS")
+
+__all__ = [*BUNDLE_NAMES, "DATA_DIR",
+           "to_name", "to_id", "is_node", "to_pos", "get_cost", "get_cost_type"]
 
 
 def to_name(node_pos: tuple[int, int]) -> str:
@@ -54,13 +41,22 @@ def to_name(node_pos: tuple[int, int]) -> str:
     return HOTM_TREE[node_pos[0]][node_pos[1]]
 
 
+def to_id(node_name: str) -> int:
+    """
+    Get the HOTM node ID from the name, which indexes the NODE_ tables and HOTM_TAKEN.
+
+    @node_name: The name of the node.
+    """
+    return NODE_IDS[node_name]
+
+
 def is_node(node_name: str) -> bool:
     """
     Check if a HOTM node name exists.
 
     @node_name: The name of the node.
     """
-    return node_name in NODE_NAMES
+    return node_name in NODE_IDS
 
 
 def to_pos(node_name: str) -> tuple[int, int]:
@@ -82,9 +78,18 @@ def get_cost(node_name: str, level: int) -> int:
     if node_name not in HOTM_POWDER_EXPONENT or HOTM_POWDER_EXPONENT[node_name] is None:
         raise ValueError(f"node not found or not leveled: {node_name}")
 
-    pad = HOTM_POWDER_LEVEL_PAD.get(node_name, 1)
-    exp = HOTM_POWDER_EXPONENT[node_name]
+    return get_level_cost(HOTM_POWDER_EXPONENT[node_name],
+                          HOTM_POWDER_LEVEL_PAD.get(node_name, 1), level)
 
+
+def get_level_cost(exp: float, pad: int, level: int) -> int:
+    """
+    Calculates the cost of the next purchase from the powder exponent and level pad of a node.
+
+    @exp: The powder exponent of the node.
+    @pad: The level pad of the node.
+    @level: The integer levels already purchased on the node.
+    """
     # The formula for cost at a specific level L is (L + pad)^exp
     cost = (level + pad + 1) ** exp
     return int(cost)
@@ -94,36 +99,224 @@ def get_cost_type(name: str) -> str:
     return POWDER_TYPES[to_pos(name)[0]]
 
 
-MAX_LEVELS = {}
-TOTAL_COSTS = {}
-for name in NODE_NAMES:
-    perk = HOTM_PERKS[name]
-    if isinstance(perk, list) or perk["type"] != "stat" or "max_level" not in perk:
-        continue
-    MAX_LEVELS[name] = perk["max_level"]
-    costs = [0]
-    total_cost = 0
-    for i in range(1, perk["max_level"]):
-        total_cost += get_cost(name, i)
-        costs.append(total_cost)
-    TOTAL_COSTS[name] = costs
-
-
-STAT_NAMES = []
-NODE_STATS = {}
-for name, perk in HOTM_PERKS.items():
-    node_stats = []
-    if isinstance(perk, dict):
-        if perk["type"] == "stat":
-            node_stats.append(perk["stat"])
-        elif perk["type"] in ("ability", "misc"):
-            node_stats.extend(perk.get("related_stats", []))
-    elif isinstance(perk, list):
-        for subperk in perk:
-            node_stats.append(subperk["stat"])
-    NODE_STATS[name] = node_stats.copy()
-    STAT_NAMES.extend(node_stats)
-STAT_NAMES = sorted({*STAT_NAMES})
+def get_sources() -> list[str]:
+    """
+    Get the paths of the data files and this module that the bundle is built from.
+    """
+    return [__file__, *(join(DATA_DIR, file_name) for file_name in DATA_FILES.values())]
+
+
+def get_source_hashes() -> dict[str, str]:
+    """
+    Get the content hashes of the bundle sources by their paths.
+    """
+    # Only imported when the sources changed, since importing hashlib is slower than loading the bundle
+    from hashlib import sha256
+
+    hashes = {}
+    for source in get_sources():
+        with open(source, "rb") as file:
+            hashes[source] = sha256(file.read()).hexdigest()
+    return hashes
+
+
+def get_source_stats() -> dict[str, tuple[int, int]]:
+    """
+    Get the sizes and modification times of the bundle sources by their paths.
+    """
+    return {source: (stat(source).st_size, stat(source).st_mtime_ns) for source in get_sources()}
+
+
+def freeze(value):
+    """
+    Get the value with every list in it as a tuple and every dictionary as a read-only view,
+    so the tables shared by every optimization cannot be changed by one of them.
+
+    The views cannot be stored with marshal, so the tables are frozen when loaded.
+
+    @value: The table or a value in it.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    elif isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    return value
+
+
+def build_bundle() -> dict:
+    """
+    Parse the data files and build the indexes derived from them.
+    """
+    # Only imported when the bundle is built, since the bundle is loaded with marshal instead
+    from json import load
+
+    tables = {}
+    for table_name, file_name in DATA_FILES.items():
+        with open(join(DATA_DIR, file_name)) as file:
+            tables[table_name] = load(file)
+    # The raw tables stay local, so the module only ever has the frozen ones
+    HOTM_TREE = tables["HOTM_TREE"]
+    BLOCKS = tables["BLOCKS"]
+    HOTM_PERKS = tables["HOTM_PERKS"]
+    POWDER_TYPES = tables["POWDER_TYPES"]
+    exponents = tables["HOTM_POWDER_EXPONENT"]
+    pads = tables["HOTM_POWDER_LEVEL_PAD"]
+
+    NODE_NAMES = []
+    NODE_POSITIONS = {}
+    for i, row in enumerate(HOTM_TREE):
+        for j, name in enumerate(row):
+            if name is not None:
+                NODE_NAMES.append(name)
+                NODE_POSITIONS[name] = (i, j)
+
+    HOTM_BOOL = [[item is not None for item in row] for row in HOTM_TREE]
+    HOTM_TAKEN = [(i, j) for i, row in enumerate(HOTM_BOOL)
+                  for j, item in enumerate(row) if item]
+
+    BLOCK_MAP = {}
+    for block in BLOCKS:
+        BLOCK_MAP[block["name"]] = {key: value for key, value in block.items()
+                                    if key != "name"}
+
+    MAX_LEVELS = {}
+    TOTAL_COSTS = {}
+    LEVEL_DELTAS = {}
+    for name in NODE_NAMES:
+        perk = HOTM_PERKS[name]
+        if isinstance(perk, list) or perk["type"] != "stat" or "max_level" not in perk:
+            continue
+        MAX_LEVELS[name] = perk["max_level"]
+        LEVEL_DELTAS[name] = (perk["stat"], perk["delta"])
+        costs = [0]
+        total_cost = 0
+        if exponents.get(name) is None:
+            raise ValueError(f"node not found or not leveled: {name}")
+        for i in range(1, perk["max_level"]):
+            total_cost += get_level_cost(exponents[name], pads.get(name, 1), i)
+            costs.append(total_cost)
+        TOTAL_COSTS[name] = costs
+
+    STAT_NAMES = []
+    NODE_STATS = {}
+    for name, perk in HOTM_PERKS.items():
+        node_stats = []
+        if isinstance(perk, dict):
+            if perk["type"] == "stat":
+                node_stats.append(perk["stat"])
+            elif perk["type"] in ("ability", "misc"):
+                node_stats.extend(perk.get("related_stats", []))
+        elif isinstance(perk, list):
+            for subperk in perk:
+                node_stats.append(subperk["stat"])
+        NODE_STATS[name] = node_stats.copy()
+        STAT_NAMES.extend(node_stats)
+    STAT_NAMES = sorted({*STAT_NAMES})
+
+    # Each node has an integer ID in the order of NODE_NAMES and HOTM_TAKEN,
+    # and the tables by ID are lists with empty values for the nodes without levels
+    NODE_IDS = {name: node for node, name in enumerate(NODE_NAMES)}
+    NODE_PERKS = []
+    for name in NODE_NAMES:
+        perk = HOTM_PERKS[name]
+        NODE_PERKS.append(perk if isinstance(perk, list) else [perk])
+    NODE_COST_TYPES = [POWDER_TYPES[i] for i, _ in HOTM_TAKEN]
+    NODE_MAX_LEVELS = [MAX_LEVELS.get(name, 0) for name in NODE_NAMES]
+    NODE_TOTAL_COSTS = [TOTAL_COSTS.get(name, []) for name in NODE_NAMES]
+
+    # The stats of a node at a level are its init row plus the level times its delta row,
+    # and the columns are the indices of the stats that the node changes
+    STAT_IDS = {stat: index for index, stat in enumerate(STAT_NAMES)}
+    # The level deltas by node ID are of the stat index instead of the stat name
+    NODE_LEVEL_DELTAS = [None if name not in LEVEL_DELTAS else
+                         (STAT_IDS[LEVEL_DELTAS[name][0]], LEVEL_DELTAS[name][1])
+                         for name in NODE_NAMES]
+    NODE_STAT_INITS = []
+    NODE_STAT_DELTAS = []
+    NODE_STAT_COLUMNS = []
+    for effects in NODE_PERKS:
+        inits = [0] * len(STAT_NAMES)
+        deltas = [0] * len(STAT_NAMES)
+        columns = []
+        for effect in effects:
+            if effect["type"] != "stat":
+                continue
+            stat = STAT_IDS[effect["stat"]]
+            if "value" in effect:
+                inits[stat] += effect["value"]
+            else:
+                inits[stat] += effect["init"]
+                deltas[stat] += effect["delta"]
+            if stat not in columns:
+                columns.append(stat)
+        NODE_STAT_INITS.append(inits)
+        NODE_STAT_DELTAS.append(deltas)
+        NODE_STAT_COLUMNS.append(columns)
+
+    tables.update(
+        NODE_NAMES=NODE_NAMES, NODE_POSITIONS=NODE_POSITIONS, HOTM_BOOL=HOTM_BOOL,
+        HOTM_TAKEN=HOTM_TAKEN, BLOCK_MAP=BLOCK_MAP, MAX_LEVELS=MAX_LEVELS, TOTAL_COSTS=TOTAL_COSTS,
+        LEVEL_DELTAS=LEVEL_DELTAS, STAT_NAMES=STAT_NAMES, NODE_STATS=NODE_STATS,
+        NODE_IDS=NODE_IDS, NODE_PERKS=NODE_PERKS, NODE_COST_TYPES=NODE_COST_TYPES,
+        NODE_MAX_LEVELS=NODE_MAX_LEVELS, NODE_TOTAL_COSTS=NODE_TOTAL_COSTS,
+        NODE_LEVEL_DELTAS=NODE_LEVEL_DELTAS, STAT_IDS=STAT_IDS, NODE_STAT_INITS=NODE_STAT_INITS,
+        NODE_STAT_DELTAS=NODE_STAT_DELTAS, NODE_STAT_COLUMNS=NODE_STAT_COLUMNS)
+    return tables
+
+
+def write_bundle(bundle: dict):
+    """
+    Write the bundle file, or skip it if the data folder is read-only.
+
+    @bundle: The bundle with the tables and the stats and hashes of their sources.
+    """
+    # Write to a file of the process first so parallel imports never read half a bundle
+    temp_path = f"{BUNDLE_PATH}.{getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            dump(bundle, file)
+        replace(temp_path, BUNDLE_PATH)
+    except OSError:
+        try:
+            remove(temp_path)
+        except OSError:
+            pass
+
+
+def load_bundle() -> dict:
+    """
+    Load the tables from the bundle file, rebuilding it when the content of any source changed.
+    """
+    stats = get_source_stats()
+    try:
+        with open(BUNDLE_PATH, "rb") as file:
+            bundle = load_marshal(file)
+    except (OSError, EOFError, ValueError, TypeError):  # A missing or broken bundle is rebuilt
+        bundle = {}
+    if isinstance(bundle, dict) and bundle.get("version") == marshal_version:
+        if bundle["stats"] == stats:
+            return bundle["tables"]
+        # Sources touched without content changes, like from a checkout, keep their tables
+        hashes = get_source_hashes()
+        if bundle["hashes"] == hashes:
+            write_bundle({**bundle, "stats": stats})
+            return bundle["tables"]
+    else:
+        hashes = get_source_hashes()
+
+    tables = build_bundle()
+    write_bundle({"version": marshal_version, "stats": stats, "hashes": hashes, "tables": tables})
+    return tables
+
+
+def __getattr__(name: str):
+    # The helpers above read the tables as globals, which a star import or any table use loads
+    if name in BUNDLE_NAMES:
+        globals().update((table_name, freeze(table))
+                         for table_name, table in load_bundle().items())
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # ability_cooldown_reduction
 # block_fortune
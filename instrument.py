@@ -0,0 +1,119 @@
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from time import perf_counter
+
+
+__all__ = ["Instruments", "INSTRUMENTS", "enable", "disable", "phase", "timed", "count"]
+
+
+class Instruments:
+    """
+    Wall time of each phase and counts of the work done in the optimizer and pathfinding.
+
+    The time of a phase includes the phases inside of it, and the work of worker processes
+    is not counted, so use one worker to see all of a tree search.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counts = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time a phase, adding to the time and calls of its earlier runs.
+
+        @name: The name of the phase.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += perf_counter() - start
+            self.calls[name] += 1
+
+    def count(self, name: str, amount: int = 1):
+        self.counts[name] += amount
+
+    def report(self) -> dict:
+        """
+        Get the phases with their seconds and calls, and the counts, each sorted by name.
+        """
+        return {
+            "phases": {name: {"seconds": self.seconds[name], "calls": self.calls[name]}
+                       for name in sorted(self.seconds)},
+            "counts": dict(sorted(self.counts.items())),
+        }
+
+    def to_json(self) -> str:
+        # Only imported for a report, since the optimizer itself never needs json
+        from json import dumps
+
+        return dumps(self.report(), indent=2)
+
+
+# The instruments that the optimizer and pathfinding report to, or None when not enabled
+INSTRUMENTS: Instruments | None = None
+
+
+def enable() -> Instruments:
+    """
+    Start reporting to new instruments and return them.
+    """
+    global INSTRUMENTS
+    INSTRUMENTS = Instruments()
+    return INSTRUMENTS
+
+
+def disable() -> Instruments | None:
+    """
+    Stop reporting and return the instruments that were reported to.
+    """
+    global INSTRUMENTS
+    instruments = INSTRUMENTS
+    INSTRUMENTS = None
+    return instruments
+
+
+def phase(name: str):
+    """
+    Time a phase if the instruments are enabled.
+
+    @name: The name of the phase.
+    """
+    if INSTRUMENTS is None:
+        return nullcontext()
+    return INSTRUMENTS.phase(name)
+
+
+def timed(name: str):
+    """
+    Decorate a function to time its calls as a phase if the instruments are enabled.
+
+    Only use it on functions that are not recursive, since the time of a phase
+    includes the phases inside of it.
+
+    @name: The name of the phase.
+    """
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if INSTRUMENTS is None:
+                return func(*args, **kwargs)
+            with INSTRUMENTS.phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name: str, amount: int = 1):
+    """
+    Add to a count if the instruments are enabled.
+
+    @name: The name of the count.
+    @amount: The amount to add.
+    """
+    if INSTRUMENTS is not None:
+        INSTRUMENTS.counts[name] += amount
@@ -1,10 +1,45 @@
+from argparse import ArgumentParser
+
+import instrument
+from cache import ResultCache
 from config import CONFIG
 from optimizer import Optimizer
+from render import print_result
 
 
 def main():
-    optimizer = Optimizer(CONFIG)
-    optimizer.optimize()
+    parser = ArgumentParser(description="Optimize the HOTM tree of config.py.")
+    parser.add_argument("--report", nargs="?", const="-",
+                        help="time the phases and count the work of the optimization,"
+                             " written as JSON to the file or printed if not given")
+    parser.add_argument("--cprofile",
+                        help="profile the optimization with cProfile and dump the stats to the file")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="optimize again instead of using a stored result")
+    args = parser.parse_args()
+
+    optimizer = Optimizer(CONFIG, None if args.no_cache else ResultCache())
+    if args.report is not None:
+        instruments = instrument.enable()
+    if args.cprofile is not None:
+        from cProfile import Profile
+
+        profiler = Profile()
+        result = profiler.runcall(optimizer.optimize)
+        profiler.dump_stats(args.cprofile)
+    else:
+        result = optimizer.optimize()
+    print_result(result)
+
+    if args.report is not None:
+        instrument.disable()
+        if optimizer.cache is not None:
+            instruments.count("cache_evictions", optimizer.cache.evictions)
+        if args.report == "-":
+            print(instruments.to_json())
+        else:
+            with open(args.report, "w") as file:
+                file.write(instruments.to_json())
 
 
 if __name__ == "__main__":
@@ -1,32 +1,71 @@
+from bisect import bisect_right
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import astuple, dataclass, field, replace
+from itertools import combinations, product
+from heapq import heapify, heappop, heappush
 from math import floor, inf
+import os
+from os.path import dirname, join
 from typing import Iterable
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import instrument
+from cache import ResultCache, get_key
 from data import *
-from pathfind import to_set_pos, find_trees
-from strings import snake_to_title
+from data import get_source_stats
+from instrument import timed
+from pathfind import find_trees
 
 
-def print_tree(names: list[str], max_hotm: int = 10):
-    for i, row in enumerate(HOTM_TREE[max_hotm-1::-1]):
-        hi = max_hotm - 1 - i
-        print(''.join('C' if (hi, pi) == (
-            4, 3) else '1' if perk in names else '0' if perk is not None else ' ' for pi, perk in enumerate(row)))
+if np is not None:
+    # Node by stat matrices for the batched stats, the same rows as get_stats uses
+    STAT_INIT_MATRIX = np.array(NODE_STAT_INITS, dtype=float)
+    STAT_DELTA_MATRIX = np.array(NODE_STAT_DELTAS, dtype=float)
 
+GREAT_EXPLORER = to_id("great_explorer")
+CORE_OF_THE_MOUNTAIN = to_id("core_of_the_mountain")
+# The number of best trees that optimize ranks in the tree search
+TOP_TREES = 3
 
-def print_tree_coords(pairs: list[tuple[int]], max_hotm: int = 10):
-    for ri in range(max_hotm - 1, -1, -1):
-        for ci in range(7):
-            if HOTM_TREE[ri][ci] is None:
-                print(' ', end='')
-                continue
-            if (ri, ci) == (4, 3):
-                print('C', end='')
-            elif (ri, ci) in pairs:
-                print('1', end='')
-            else:
-                print('0', end='')
-        print()
+# The config fields that Profile.compile reads, for the fingerprint of the score.
+# Every field read by a branch of the score should be listed with that branch.
+SCORE_FIELDS = ("mode", "ore", "consider_fortune", "reaction_speed", "using_blue_cheese",
+                "mining_speed", "flowstate_level", "mining_spread")
+FORTUNE_FIELDS = ("mining_fortune", "mining_fortune_mult")
+ORE_FIELDS = {
+    "block": ("block_spread", "ore_and_block_spread"),
+    "hardstone": ("block_spread", "ore_and_block_spread"),
+    "ore": ("dwarven_mines_speed", "ore_and_block_spread", "mines_of_divan_spread"),
+    "mithril": ("mithril_speed", "dwarven_mines_speed"),
+    "titanium": ("dwarven_mines_speed",),
+    "glacite": ("dwarven_mines_speed",),
+    "aquamarine": ("dwarven_mines_speed",),
+}
+# The fortune of gemstones is multiplied by the pristine chance
+ORE_FORTUNE_FIELDS = {
+    "block": ("block_fortune",),
+    "hardstone": ("block_fortune",),
+    "ore": ("ore_fortune",),
+    "mithril": ("dwarven_mines_fortune", "dwarven_metal_fortune"),
+    "titanium": ("titanium_fortune", "dwarven_mines_fortune", "dwarven_metal_fortune"),
+    "glacite": ("mineshafts_fortune",),
+    "ruby": ("gemstone_fortune", "pristine"),
+    "amber": ("crystal_hollows_fortune", "gemstone_fortune", "pristine"),
+    "topaz": ("gemstone_fortune", "pristine", "magma_fields_pristine"),
+    "jasper": ("gemstone_fortune", "pristine"),
+    "aquamarine": ("mineshafts_fortune", "gemstone_fortune", "pristine"),
+}
+MODE_FIELDS = {"ores": (), "exp": ("mining_wisdom",)}
+POWDER_FIELDS = {
+    "mithril": ("mithril_powder_boost", "core_of_the_mountain", "use_titanium"),
+    "gemstone": ("gemstone_powder_boost", "treasure_chest_chance"),
+    "glacite": ("glacite_powder_boost",),
+}
 
 
 def round_tick(t, is_hardstone=False):
@@ -38,8 +77,20 @@ def round_tick(t, is_hardstone=False):
     return ticks / 20
 
 
+def round_ticks(t, is_hardstone=False):
+    """
+    Array version of round_tick for batched evaluations.
+    """
+    ticks = np.round(t * 20)
+    ticks = np.where((1 <= ticks) & (ticks < 4), 4, ticks)
+    if is_hardstone:
+        ticks = np.where(t * 20 < 1, 0, ticks)
+    return ticks / 20
+
+
 class Profile:
     def __init__(self, config):
+        self.config = config
         self.heart_of_the_mountain = self.hotm = config["heart_of_the_mountain"]
         self.core_of_the_mountain = self.cotm = config["core_of_the_mountain"]
         self.tokens = TOKENS_HOTM[self.hotm - 1] + TOKENS_COTM[self.cotm - 1]
@@ -174,6 +225,9 @@ class Profile:
             raise ValueError(f"target amount must be either None or a number,"
                              f" got {type(self.target_amount)}")
 
+        # The score functions by the rounding and batch options, filled in by compile
+        self.compiled = {}
+
     def print_info(self):
         print(f"Optimizer Mode: {self.mode}")
         print(f"HOTM Level: {self.hotm}")
@@ -183,208 +237,441 @@ class Profile:
         print(f"Gemstone Powder: {self.gemstone_powder}")
         print(f"Glacite Powder:  {self.glacite_powder}")
 
-    def get_stats(self, levels: defaultdict[str, int]) -> defaultdict[str, float]:
-        result = defaultdict(int)
-        for name, level in levels.items():
-            perks = HOTM_PERKS[name]
-            for effect in perks if isinstance(perks, list) else [perks]:
-                if effect["type"] == "stat":
-                    if "max_level" in effect:
-                        result[effect["stat"]] += effect["init"] + \
-                            (level + self.using_blue_cheese) * effect["delta"]
-                    else:
-                        result[effect["stat"]] += effect["value"]
-        return result
+    def get_time_to_target(self, score: float) -> float | None:
+        """
+        Get the seconds to reach the target amount at a score, or None if there is no target.
+
+        A score of zero never reaches the target, which takes inf seconds.
+
+        @score: The amount per minute.
+        """
+        if self.target_amount is None:
+            return None
+        if score <= 0:
+            return inf
+        return floor(self.target_amount / score * 60)
+
+    def get_stats(self, levels: defaultdict[int, int]) -> list[float]:
+        """
+        Get the stat vector of the tree from the init and delta rows of each node.
+
+        @levels: Dictionary of HOTM levels in the tree by node ID.
+        """
+        if instrument.INSTRUMENTS is not None:
+            instrument.INSTRUMENTS.counts["get_stats"] += 1
+        totals = [0] * len(STAT_NAMES)
+        for node, level in levels.items():
+            # Blue cheese gives every node one more level
+            level += self.using_blue_cheese
+            inits = NODE_STAT_INITS[node]
+            deltas = NODE_STAT_DELTAS[node]
+            for stat in NODE_STAT_COLUMNS[node]:
+                totals[stat] += inits[stat] + level * deltas[stat]
+        return totals
 
-    def eval(self, levels: defaultdict[str, int], do_round=False):
+    def eval(self, levels: defaultdict[int, int], do_round=False):
         """
         Evaluate efficiency score in the set mode.
 
-        @levels: Dictionary of HOTM levels in the tree. All selected nodes should have level at least 1.
+        @levels: Dictionary of HOTM levels in the tree by node ID. All selected nodes should have level at least 1.
+        @do_round: Whether to round tick for more accurate result at the cost of slower optimization.
+        """
+        if instrument.INSTRUMENTS is not None:
+            instrument.INSTRUMENTS.counts["evals"] += 1
+        return self.compile(do_round)(self.get_stats(levels), levels.get(GREAT_EXPLORER, 0))
+
+    def eval_batch(self, nodes: list[int], levels, do_round=False):
+        """
+        Evaluate efficiency scores of many level vectors at once in the set mode.
+
+        The mode and ore branches are resolved once for the whole batch with NumPy array math,
+        or each row is evaluated on its own if NumPy is not installed.
+
+        @nodes: The node IDs for the columns of the level matrix.
+        @levels: The N by len(nodes) matrix of HOTM levels, one row for each tree allocation.
+        @do_round: Whether to round tick for more accurate result at the cost of slower optimization.
+        """
+        if np is None:
+            return [self.eval(defaultdict(int, zip(nodes, row)), do_round)
+                    for row in levels]
+        levels = np.asarray(levels)
+        instrument.count("batch_evals", len(levels))
+        deltas = STAT_DELTA_MATRIX[nodes]
+        # The init rows and the blue cheese level are the same for every row of the batch
+        base = (STAT_INIT_MATRIX[nodes] + self.using_blue_cheese * deltas).sum(axis=0)
+        stats = base.tolist()
+        # Only the stats with a delta change between rows, and the rest stay numbers
+        columns = np.flatnonzero(deltas.any(axis=0))
+        totals = deltas[:, columns].T @ levels.T + base[columns, None]
+        for stat, total in zip(columns.tolist(), totals):
+            stats[stat] = total
+        if GREAT_EXPLORER in nodes:
+            great_explorer_level = levels[:, nodes.index(GREAT_EXPLORER)]
+        else:
+            great_explorer_level = np.zeros(len(levels))
+        result = self.compile(do_round, batch=True)(stats, great_explorer_level)
+        return np.broadcast_to(result, (len(levels),))
+
+    def compile(self, do_round=False, batch=False):
+        """
+        Get the score function of the set mode over a stat vector with the mode, ore and
+        config stats resolved once, cached for each rounding and batch option.
+
+        The function takes the stat vector indexed by STAT_IDS and the Great Explorer level,
+        and the stats of the vector and the level are NumPy arrays if batched.
+        The profile should not be changed after it is compiled.
+
         @do_round: Whether to round tick for more accurate result at the cost of slower optimization.
+        @batch: Whether the stats are NumPy arrays of a batch.
         """
-        stats = self.get_stats(levels)
+        if (do_round, batch) in self.compiled:
+            return self.compiled[do_round, batch]
+
+        def get_ids(*stats: str) -> tuple[int, ...]:
+            # The stats that no node gives are always zero
+            return tuple(STAT_IDS[stat] for stat in stats if stat in STAT_IDS)
+
+        tick = round_ticks if batch else round_tick
         if self.ore == "mithril":
             block = BLOCK_MAP["blue_mithril"]
         else:
             block = BLOCK_MAP[self.ore]
         is_gemstone = self.ore in (
             "ruby", "amber", "topaz", "jasper", "aquamarine")
+        is_titanium = self.ore == "titanium"
 
-        mining_speed = self.mining_speed + stats["mining_speed"]
-        mining_speed += self.flowstate_level * 200
-        mining_fortune = self.mining_fortune + stats["mining_fortune"]
-        mining_fortune += self.fiesta_fortune * self.is_fiesta
-        mining_spread = self.mining_spread + stats["mining_spread"]
-        mining_wisdom = self.mining_wisdom + stats["mining_wisdom"]
-        powder_rate = 1 + self.global_powder_boost
-        powder_rate += self.fiesta_powder_boost * self.is_fiesta
-        powder_rate += stats["powder_gain"] / 100
+        # Each summed stat is a constant from the config plus the stats of the tree
+        speed_base = self.mining_speed + self.flowstate_level * 200
+        speed_ids = ["mining_speed"]
+        fortune_base = self.mining_fortune + self.fiesta_fortune * self.is_fiesta
+        fortune_ids = ["mining_fortune"]
+        spread_base = self.mining_spread
+        spread_ids = ["mining_spread"]
         pristine = self.pristine
-        titanium_chance = stats["titanium_chance"]
-        titanium_chance += self.fiesta_titanium_chance * self.is_fiesta
+        titanium_base = self.fiesta_titanium_chance * self.is_fiesta
 
         if self.ore in ("block", "hardstone"):
-            mining_fortune += stats["block_fortune"]
-            mining_fortune += self.block_fortune
-            mining_spread += self.block_spread
-            mining_spread += self.ore_and_block_spread
+            fortune_ids.append("block_fortune")
+            fortune_base += self.block_fortune
+            spread_base += self.block_spread + self.ore_and_block_spread
             if self.ore == "hardstone":
-                mining_spread += stats["hardstone_spread"]
+                spread_ids.append("hardstone_spread")
         elif self.ore == "ore":
-            mining_speed += self.dwarven_mines_speed
-            mining_speed += stats["ore_speed"]
-            mining_fortune += self.ore_fortune
-            mining_fortune += stats["ore_fortune"]
-            mining_spread += self.ore_and_block_spread
-            mining_spread += self.mines_of_divan_spread
+            speed_base += self.dwarven_mines_speed
+            speed_ids.append("ore_speed")
+            fortune_base += self.ore_fortune
+            fortune_ids.append("ore_fortune")
+            spread_base += self.ore_and_block_spread + self.mines_of_divan_spread
         elif self.ore == "mithril":
-            mining_speed += self.mithril_speed
-            mining_speed += self.dwarven_mines_speed
-            mining_speed += stats["dwarven_metal_speed"]
-            mining_fortune += self.dwarven_mines_fortune
-            mining_fortune += self.dwarven_metal_fortune
+            speed_base += self.mithril_speed + self.dwarven_mines_speed
+            speed_ids.append("dwarven_metal_speed")
+            fortune_base += self.dwarven_mines_fortune + self.dwarven_metal_fortune
         elif self.ore == "titanium":
-            mining_fortune += self.titanium_fortune
-            mining_speed += self.dwarven_mines_speed
-            mining_speed += stats["dwarven_metal_speed"]
-            mining_fortune += self.dwarven_mines_fortune
-            mining_fortune += self.dwarven_metal_fortune
+            fortune_base += self.titanium_fortune
+            speed_base += self.dwarven_mines_speed
+            speed_ids.append("dwarven_metal_speed")
+            fortune_base += self.dwarven_mines_fortune + self.dwarven_metal_fortune
         elif self.ore == "amber":
-            mining_fortune += self.crystal_hollows_fortune
+            fortune_base += self.crystal_hollows_fortune
         elif self.ore == "topaz":
             pristine += self.magma_fields_pristine
         elif self.ore == "glacite":
-            mining_speed += self.dwarven_mines_speed
-            mining_speed += stats["dwarven_metal_speed"]
-            mining_fortune += self.mineshafts_fortune * 0.3
-            mining_spread += stats["mineshaft_mining_spread"]
+            speed_base += self.dwarven_mines_speed
+            speed_ids.append("dwarven_metal_speed")
+            fortune_base += self.mineshafts_fortune * 0.3
+            spread_ids.append("mineshaft_mining_spread")
         elif self.ore == "aquamarine":
             # TODO: tweak this based on cold resist
             # TODO: or a more accurate average
-            mining_speed += self.dwarven_mines_speed
-            mining_fortune += self.mineshafts_fortune * 0.3
-            mining_spread += stats["mineshaft_gemstone_spread"]
+            speed_base += self.dwarven_mines_speed
+            fortune_base += self.mineshafts_fortune * 0.3
+            spread_ids.append("mineshaft_gemstone_spread")
 
-        blocks = 1
-        cycle_time = 1
-        if self.ore == "titanium":
-            mithrils = 100 / titanium_chance
-            mithril_str = BLOCK_MAP["blue_mithril"]["block_strength"]
-            titanium_str = BLOCK_MAP["titanium"]["block_strength"]
-            mithril_time = 1.5 * mithril_str / mining_speed
-            titanium_time = 1.5 * titanium_str / mining_speed
-            if do_round:
-                mithril_time = round_tick(mithril_time)
-                titanium_time = round_tick(titanium_time)
-            cycle_time = mithril_time * mithrils + titanium_time
-            blocks = mithrils + 1
-        else:
-            block_str = block["block_strength"]
-            block_time = 1.5 * block_str / mining_speed
-            if do_round:
-                block_time = round_tick(block_time)
-            cycle_time = block_time
-        cycle_time += self.reaction_speed * blocks
+        consider_fortune = self.consider_fortune
+        fortune_mult_base = 1 + self.mining_fortune_mult
+        # The gemstone speed is added after the mining time, so it is left out
+        if consider_fortune and is_gemstone:
+            fortune_base += self.gemstone_fortune
+            fortune_ids.append("gemstone_fortune")
+        pristine_chance = pristine / 100
+        pristine_mult = (1 - pristine_chance) + 20 * pristine_chance
 
-        if self.consider_fortune:
-            if is_gemstone:
-                mining_speed += self.gemstone_speed
-                mining_speed += stats["gemstone_speed"]
-                mining_fortune += self.gemstone_fortune
-                mining_fortune += stats["gemstone_fortune"]
-            mining_fortune *= 1 + self.mining_fortune_mult
-            fortune_mult = 1 + mining_fortune / 100
-            if self.ore == "titanium":
-                fortune_mult *= stats["titanium_drop"]
-            elif is_gemstone:
-                pristine_chance = pristine / 100
-                fortune_mult = fortune_mult * (1 - pristine_chance) + \
-                    fortune_mult * 20 * pristine_chance
+        block_str = block["block_strength"]
+        mithril_str = BLOCK_MAP["blue_mithril"]["block_strength"]
+        titanium_str = BLOCK_MAP["titanium"]["block_strength"]
+        reaction_speed = self.reaction_speed
 
-        value = 0
-        if self.mode in ("ores", "exp"):
-            value = block["drops"][1]
+        speed_ids = get_ids(*speed_ids)
+        fortune_ids = get_ids(*fortune_ids)
+        spread_ids = get_ids(*spread_ids)
+        titanium_id, titanium_drop_id = get_ids("titanium_chance", "titanium_drop")
+        wisdom_ids = get_ids("mining_wisdom")
+        powder_gain_ids = get_ids("powder_gain")
+
+        mode = self.mode
+        powder_type = self.powder_type
+        value_base = 0
+        powder_base = 1 + self.global_powder_boost + self.fiesta_powder_boost * self.is_fiesta
+        powder_ids = ()
+        wisdom_base = self.mining_wisdom
+        chest_ids = ()
+        if mode in ("ores", "exp"):
+            value_base = block["drops"][1]
             if not is_gemstone and self.compact_level > 0:
-                value += 160 * COMPACT_CHANCES[self.compact_level - 1] / 100
-            if self.consider_fortune:
-                value *= fortune_mult
-            if self.mode == "exp":
-                value *= 1 + mining_wisdom / 100
-            value *= 1 + mining_spread / 100
-        elif self.mode == "powder":
-            if self.powder_type == "mithril":
-                powder_rate += self.mithril_powder_boost
-                powder_rate += stats["mithril_powder"]
-                value = 5 + (self.cotm >= 4)
-                if self.use_titanium:
-                    mithrils = 100 / titanium_chance
-                    value = value * mithrils + self.titanium_powder_gain
-            elif self.powder_type == "gemstone":
-                powder_rate += self.gemstone_powder_boost
-                powder_rate += stats["gemstone_powder"]
-                chance_boost = self.treasure_chest_chance
-                chance_boost += stats["treasure_chest_chance"] / 100
-                chest_chance = 0.002 * (1 + chance_boost)
-                great_explorer_level = levels["great_explorer"]
-                chests = (1 + mining_spread / 100) * chest_chance
-                if great_explorer_level == 0:
-                    locks = 5
-                else:
-                    if do_round:
-                        locks = 4 - great_explorer_level // 5
-                    else:
-                        locks = 4 - great_explorer_level / 5
-                cycle_time += chests * \
-                    (locks + self.reaction_speed) + self.reaction_speed
-                value = 349.0054361184384
-            elif self.powder_type == "glacite":
-                powder_rate += stats["glacite_powder"]
-                value = 1
-                powder_rate += self.glacite_powder_boost
-                powder_rate += self.glacite_powder_gain
+                value_base += 160 * COMPACT_CHANCES[self.compact_level - 1] / 100
+        elif powder_type == "mithril":
+            powder_base += self.mithril_powder_boost
+            powder_ids = get_ids("mithril_powder")
+            value_base = 5 + (self.cotm >= 4)
+        elif powder_type == "gemstone":
+            powder_base += self.gemstone_powder_boost
+            powder_ids = get_ids("gemstone_powder")
+            chest_ids = get_ids("treasure_chest_chance")
+            value_base = 349.0054361184384
+        elif powder_type == "glacite":
+            powder_base += self.glacite_powder_boost + self.glacite_powder_gain
+            powder_ids = get_ids("glacite_powder")
+            value_base = 1
+        else:
+            raise ValueError(f"unknown powder type: {powder_type}")
+        use_titanium = self.use_titanium
+        titanium_powder_gain = self.titanium_powder_gain
+        chest_base = self.treasure_chest_chance
+
+        def score(stats, great_explorer_level):
+            mining_speed = speed_base
+            for stat in speed_ids:
+                mining_speed = mining_speed + stats[stat]
+            mining_spread = spread_base
+            for stat in spread_ids:
+                mining_spread = mining_spread + stats[stat]
+
+            if is_titanium:
+                mithrils = 100 / (titanium_base + stats[titanium_id])
+                mithril_time = 1.5 * mithril_str / mining_speed
+                titanium_time = 1.5 * titanium_str / mining_speed
+                if do_round:
+                    mithril_time = tick(mithril_time)
+                    titanium_time = tick(titanium_time)
+                cycle_time = mithril_time * mithrils + titanium_time
+                cycle_time += reaction_speed * (mithrils + 1)
             else:
-                raise ValueError(f"unknown powder type: {self.powder_type}")
-            value *= powder_rate
-            if self.consider_fortune:
-                value *= fortune_mult
-            if self.powder_type != "gemstone":
-                value *= 1 + mining_spread / 100
+                block_time = 1.5 * block_str / mining_speed
+                if do_round:
+                    block_time = tick(block_time)
+                cycle_time = block_time + reaction_speed
 
-        return value / cycle_time * 60
+            if consider_fortune:
+                mining_fortune = fortune_base
+                for stat in fortune_ids:
+                    mining_fortune = mining_fortune + stats[stat]
+                fortune_mult = 1 + mining_fortune * fortune_mult_base / 100
+                if is_titanium:
+                    fortune_mult = fortune_mult * stats[titanium_drop_id]
+                elif is_gemstone:
+                    fortune_mult = fortune_mult * pristine_mult
 
+            if mode in ("ores", "exp"):
+                value = value_base
+                if consider_fortune:
+                    value = value * fortune_mult
+                if mode == "exp":
+                    mining_wisdom = wisdom_base
+                    for stat in wisdom_ids:
+                        mining_wisdom = mining_wisdom + stats[stat]
+                    value = value * (1 + mining_wisdom / 100)
+                return value * (1 + mining_spread / 100) / cycle_time * 60
 
-class Optimizer:
-    def __init__(self, config):
-        self.profile = Profile(config)
-        if self.profile.given_tree is None:
-            raise ValueError("tree pathfind not implemented yet")
-        self.trees = [to_set_pos(self.profile.given_tree)]
+            powder_rate = powder_base
+            for stat in powder_gain_ids:
+                powder_rate = powder_rate + stats[stat] / 100
+            for stat in powder_ids:
+                powder_rate = powder_rate + stats[stat]
+            value = value_base
+            if powder_type == "mithril" and use_titanium:
+                mithrils = 100 / (titanium_base + stats[titanium_id])
+                value = value * mithrils + titanium_powder_gain
+            elif powder_type == "gemstone":
+                chance_boost = chest_base
+                for stat in chest_ids:
+                    chance_boost = chance_boost + stats[stat] / 100
+                chests = (1 + mining_spread / 100) * (0.002 * (1 + chance_boost))
+                if do_round:
+                    locks = 4 - great_explorer_level // 5
+                else:
+                    locks = 4 - great_explorer_level / 5
+                if batch:
+                    locks = np.where(great_explorer_level == 0, 5, locks)
+                elif great_explorer_level == 0:
+                    locks = 5
+                cycle_time = cycle_time + chests * (locks + reaction_speed) + reaction_speed
+            value = value * powder_rate
+            if consider_fortune:
+                value = value * fortune_mult
+            if powder_type != "gemstone":
+                value = value * (1 + mining_spread / 100)
+            return value / cycle_time * 60
 
-        self.levels = defaultdict(int)
-        self.mithril_powder = 0
-        self.gemstone_powder = 0
-        self.glacite_powder = 0
+        self.compiled[do_round, batch] = score
+        return score
 
-    def find_trees(self):
-        abilities = []
-        nodes = []
-        trees = find_trees(abilities, nodes,
-                           self.profile.hotm, self.profile.tokens)
+    def get_fingerprint(self) -> tuple:
+        """
+        Get the config fields that the score of a tree depends on, which leaves out the ones
+        that the set mode and ore do not use.
 
-    def print_info(self):
-        self.profile.print_info()
+        The fields are listed by mode, ore and powder type in SCORE_FIELDS and the tables
+        after it, which should be kept the same as the branches of compile.
+        """
+        is_gemstone = self.ore in ("ruby", "amber", "topaz", "jasper", "aquamarine")
+        names = [*SCORE_FIELDS, *ORE_FIELDS.get(self.ore, ())]
+        fiesta_names = []
+        if self.consider_fortune:
+            names += [*FORTUNE_FIELDS, *ORE_FORTUNE_FIELDS.get(self.ore, ())]
+            fiesta_names.append("fiesta_fortune")
+        if self.ore == "titanium":
+            fiesta_names.append("fiesta_titanium_chance")
+        if self.mode in ("ores", "exp"):
+            names += MODE_FIELDS[self.mode]
+            if not is_gemstone:
+                names.append("compact_level")
+        else:
+            names += ["powder_type", "global_powder_boost", *POWDER_FIELDS[self.powder_type]]
+            if self.powder_type == "mithril" and self.use_titanium:
+                names.append("titanium_powder_gain")
+            fiesta_names.append("fiesta_powder_boost")
+        if self.is_fiesta:
+            names += ["is_fiesta", *fiesta_names]
+        # The attributes hold the fields as resolved for the mode, like the ore of powder mode
+        return tuple((name, getattr(self, name)) for name in names)
+
+    def get_score_stats(self) -> frozenset[int]:
+        """
+        Get the IDs of the stats that the score function reads in the set mode and ore,
+        which can differ from the stats used from TASK_STATS.
 
-    def get_cost(self, name: str) -> tuple[str, int]:
-        if self.levels[name] == 0:
+        The branches of the score only depend on the profile, so one call
+        with a stat vector that records its reads finds all of them.
+        """
+        stats = _StatReads([1] * len(STAT_NAMES))
+        try:
+            self.compile()(stats, 1)
+        except ArithmeticError:  # A config that breaks the score counts every stat
+            return frozenset(range(len(STAT_NAMES)))
+        return frozenset(stats.reads)
+
+
+class _StatReads(list):
+    # A stat vector that records the IDs of the stats read from it
+    def __init__(self, values):
+        super().__init__(values)
+        self.reads = set()
+
+    def __getitem__(self, index):
+        self.reads.add(index)
+        return super().__getitem__(index)
+
+
+@dataclass
+class OptimizeResult:
+    """
+    The result of Optimizer.optimize, with the nodes as IDs.
+
+    @unit: The snake case name of what the score counts, like mithril_powder or titanium.
+    @stats_used: The stats relevant to the optimization.
+    @tree: The IDs of the nodes in the tree used.
+    @sig_nodes: The IDs of the nodes in the tree that give relevant stats.
+    @opti_nodes: The IDs of the significant nodes with levels to optimize.
+    @levels: The levels of the nodes in the tree by ID.
+    @score: The optimized score per minute.
+    @powder_left: The powder left by type.
+    @time_to_target: The seconds to reach the target amount, inf if the score is zero,
+                     or None if there is no target.
+    @greedy_score: The score of the greedy allocation for an exact optimization, or None.
+    @trees: The searched trees ranked by their scores, or empty if the tree is given.
+    """
+    unit: str
+    stats_used: list[str]
+    tree: tuple[int, ...]
+    sig_nodes: tuple[int, ...]
+    opti_nodes: tuple[int, ...]
+    levels: dict[int, int]
+    score: float
+    powder_left: dict[str, int]
+    time_to_target: float | None = None
+    greedy_score: float | None = None
+    trees: list[tuple[float, tuple[int, ...]]] = field(default_factory=list)
+
+    @property
+    def score_per_hour(self) -> float:
+        return self.score * 60
+
+    def to_dict(self) -> dict:
+        """
+        Get the result as a JSON object with the nodes by name, and the levels
+        of only the optimizable nodes.
+        """
+        return {
+            "unit": self.unit,
+            "stats_used": [*self.stats_used],
+            "tree": [NODE_NAMES[node] for node in sorted(self.tree)],
+            "levels": {NODE_NAMES[node]: self.levels[node] for node in sorted(self.opti_nodes)},
+            "score": self.score,
+            "score_per_hour": self.score_per_hour,
+            "powder_left": {**self.powder_left},
+            # JSON has no inf, so a target that is never reached has no time
+            "time_to_target": None if self.time_to_target == inf else self.time_to_target,
+            "greedy_score": self.greedy_score,
+            "trees": [{"score": score, "tree": [NODE_NAMES[node] for node in sorted(tree)]}
+                      for score, tree in self.trees],
+        }
+
+
+class Allocation:
+    """
+    The levels of a tree and the powder left to spend while it is optimized.
+
+    Each allocation has its own, so the optimizer itself is never changed by one
+    and can run many of them at once from threads.
+    """
+
+    def __init__(self, levels: defaultdict[int, int], powders: tuple[int, int, int]):
+        """
+        @levels: Dictionary of HOTM levels in the tree by node ID.
+        @powders: The mithril, gemstone and glacite powder left to spend.
+        """
+        self.levels = levels
+        self.powders = powders
+        # The score of the allocation, and of the greedy allocation for an exact search
+        self.score = None
+        self.greedy_score = None
+
+    @property
+    def powders(self) -> tuple[int, int, int]:
+        return self.mithril_powder, self.gemstone_powder, self.glacite_powder
+
+    @powders.setter
+    def powders(self, powders: tuple[int, int, int]):
+        self.mithril_powder, self.gemstone_powder, self.glacite_powder = powders
+
+    def copy(self) -> "Allocation":
+        allocation = Allocation(self.levels.copy(), self.powders)
+        allocation.score = self.score
+        allocation.greedy_score = self.greedy_score
+        return allocation
+
+    def get_cost(self, node: int) -> tuple[str, int]:
+        level = self.levels[node]
+        if level == 0:
             raise ValueError(f"cannot level up node"
-                             f" that is not selected: {name!r}")
-        return get_cost_type(name), get_cost(name, self.levels[name])
+                             f" that is not selected: {NODE_NAMES[node]!r}")
+        costs = NODE_TOTAL_COSTS[node]
+        return NODE_COST_TYPES[node], costs[level] - costs[level - 1]
 
-    def can_afford_and_cost(self, name: str) -> tuple[bool, int]:
-        if self.levels[name] >= MAX_LEVELS[name]:
+    def can_afford_and_cost(self, node: int) -> tuple[bool, int]:
+        if self.levels[node] >= NODE_MAX_LEVELS[node]:
             return False, 0
-        powder_type, cost = self.get_cost(name)
+        powder_type, cost = self.get_cost(node)
         if powder_type == "mithril":
             return self.mithril_powder >= cost, cost
         elif powder_type == "gemstone":
@@ -392,10 +679,10 @@ class Optimizer:
         else:
             return self.glacite_powder >= cost, cost
 
-    def can_afford(self, name: str) -> bool:
-        if self.levels[name] >= MAX_LEVELS[name]:
+    def can_afford(self, node: int) -> bool:
+        if self.levels[node] >= NODE_MAX_LEVELS[node]:
             return False
-        powder_type, cost = self.get_cost(name)
+        powder_type, cost = self.get_cost(node)
         if powder_type == "mithril":
             return self.mithril_powder >= cost
         elif powder_type == "gemstone":
@@ -403,17 +690,266 @@ class Optimizer:
         else:
             return self.glacite_powder >= cost
 
-    def optimize(self, tree: Iterable[tuple[int, int]] | None = None):
-        if tree is None:
-            if self.profile.given_tree is None:
-                raise ValueError("tree isn't given in config or argument")
-            tree = to_set_pos(self.profile.given_tree)
+    def get_powder(self, cost_type: str) -> int:
+        if cost_type == "mithril":
+            return self.mithril_powder
+        elif cost_type == "gemstone":
+            return self.gemstone_powder
         else:
-            tree = tuple(pos for pos in tree
-                         if to_name(pos) != "core_of_the_mountain")
-            if len(tree) > self.profile.tokens:
-                raise ValueError(f"tokens not enough to build this tree: "
-                                 f"{len(tree)}>{self.profile.tokens}")
+            return self.glacite_powder
+
+    def spend(self, cost_type: str, cost: int):
+        if cost_type == "mithril":
+            self.mithril_powder -= cost
+        elif cost_type == "gemstone":
+            self.gemstone_powder -= cost
+        else:
+            self.glacite_powder -= cost
+
+    def count_affordable_levels(self, node: int) -> int:
+        """
+        Count the consecutive levels of the node that the powder left can afford.
+
+        @node: The ID of the node to level up.
+        """
+        level = self.levels[node]
+        costs = NODE_TOTAL_COSTS[node]
+        budget = self.get_powder(NODE_COST_TYPES[node]) + costs[level - 1]
+        return bisect_right(costs, budget) - level
+
+
+class Optimizer:
+    """
+    The search of the best tree and levels for a profile.
+
+    The levels and powder of each allocation are kept on its Allocation instead of
+    the optimizer, and the data tables are read-only, so an optimizer can be shared by
+    threads. Only the searched trees and the purchase sequences are stored on it,
+    which are the same for every call.
+    """
+
+    def __init__(self, config, cache: ResultCache | None = None):
+        """
+        @config: The config dictionary in the format of config.py.
+        @cache: The store of the optimize results to reuse, or None to always optimize.
+        """
+        self.profile = Profile(config)
+        self.cache = cache
+        # The searched trees with their scores, best first, and the number of best trees
+        # they were searched for or None if all, set together so threads never see
+        # the trees of one search with the number of another
+        self.ranking = ([], None)
+        # The greedy purchases with unlimited powder by the tree and maxed powder types
+        self.purchase_sequences = {}
+
+    @property
+    def trees(self) -> list[set[int]]:
+        """
+        The given tree, or the searched trees best first.
+        """
+        if self.profile.given_tree is not None:
+            return [{to_id(name) for name in self.profile.given_tree}]
+        return [tree for _, tree in self.ranking[0]]
+
+    def get_required_nodes(self) -> set[int]:
+        """
+        Get the node IDs that every tree needs for the task to be done at all.
+        """
+        if self.profile.use_titanium:
+            # Titanium only spawns with the titanium chance from Titanium Insanium
+            return {to_id("titanium_insanium")}
+        return set()
+
+    def get_candidate_nodes(self) -> list[int]:
+        """
+        Get the IDs of the non-ability nodes in reach of the HOTM level that give relevant stats.
+        """
+        stats_used = {*self.get_stats_used()}
+        required = self.get_required_nodes()
+        candidates = []
+        for node, effects in enumerate(NODE_PERKS):
+            if HOTM_TAKEN[node][0] >= self.profile.hotm or node in required:
+                continue
+            if any(effect["type"] == "stat" and effect["stat"] in stats_used
+                   for effect in effects):
+                candidates.append(node)
+        return candidates
+
+    @timed("find_trees")
+    def find_trees(self, workers: int | None = None,
+                   top: int | None = None) -> list[tuple[float, set[int]]]:
+        """
+        Search the buildable trees and rank them by their optimized score.
+
+        Every maximal set of relevant nodes that fits in the tokens is passed on to the
+        pathfinding with each ability, and the resulting trees are allocated in parallel.
+        With a number of best trees, only the trees that can still be one of them are allocated,
+        and they are ranked the same as the first ones of the full ranking.
+
+        @workers: Number of worker processes, defaults to the CPU count and 1 runs in process.
+        @top: Number of best trees to keep, all trees are kept if None.
+        """
+        if self.profile.force_ability is not None:
+            abilities = [to_id(self.profile.force_ability)]
+        else:
+            abilities = [to_id(name) for name in ABILITIES
+                         if to_pos(name)[0] < self.profile.hotm]
+            if len(abilities) == 0:
+                abilities = [None]
+        required = self.get_required_nodes()
+        candidates = self.get_candidate_nodes()
+
+        trees = {}
+        node_sets = pruned_sets = 0
+        for ability in abilities:
+            feasible = []
+            for size in range(len(candidates), -1, -1):
+                for nodes in combinations(candidates, size):
+                    node_sets += 1
+                    nodes = {*nodes}
+                    if any(nodes <= other for other in feasible):
+                        pruned_sets += 1
+                        continue
+                    found = find_trees([ability], nodes | required,
+                                       self.profile.hotm, self.profile.tokens)
+                    if len(found) == 0:
+                        continue
+                    feasible.append(nodes)
+                    for tree in found:
+                        trees[tuple(sorted(tree))] = tree
+        instrument.count("node_sets", node_sets)
+        instrument.count("node_sets_pruned", pruned_sets)
+        instrument.count("trees_enumerated", len(trees))
+        if len(trees) == 0:
+            raise ValueError(f"no tree can be built with {self.profile.tokens} tokens"
+                             f" at HOTM {self.profile.hotm}")
+        trees = self.prune_trees([*trees.values()])
+
+        with instrument.phase("score_trees"):
+            if top is not None:
+                ranked = self.find_top_trees(trees, top, workers)
+            elif workers == 1:
+                scores = [self.allocate(tree).score for tree in trees]
+            else:
+                chunksize = max(1, len(trees) // (4 * (workers or os.cpu_count() or 1)))
+                with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                         initargs=(self.profile.config,)) as executor:
+                    scores = [*executor.map(_allocate_tree, trees,
+                                            chunksize=chunksize)]
+        if top is None:
+            ranked = sorted(zip(scores, trees), key=lambda pair: -pair[0])
+        self.ranking = (ranked, top)
+        return ranked
+
+    def get_signature(self, tree: Iterable[int], score_stats: frozenset[int]) -> int:
+        """
+        Get the bitmask of the nodes in the tree that change the score,
+        which are the nodes with a stat that the score function reads.
+
+        @tree: The IDs of the nodes in the tree.
+        @score_stats: The IDs of the stats that the score function reads.
+        """
+        signature = 0
+        for node in tree:
+            if not score_stats.isdisjoint(NODE_STAT_COLUMNS[node]):
+                signature |= 1 << node
+        return signature
+
+    def prune_trees(self, trees: list[set[int]]) -> list[set[int]]:
+        """
+        Keep only the first tree of each signature, and drop the trees with a signature
+        that is a strict subset of another, in the order of the trees.
+
+        The trees with the same signature have the same scoring nodes, so every allocation scores
+        the same on them. A tree with more scoring nodes scores at least as high with the same
+        levels since no stat lowers the score, so the best trees have the largest signatures.
+
+        @trees: The trees to prune.
+        """
+        score_stats = self.profile.get_score_stats()
+        by_signature = {}
+        for tree in trees:
+            by_signature.setdefault(self.get_signature(tree, score_stats), tree)
+        # A superset has more bits, so it is always kept before its subsets are checked
+        kept = []
+        for signature in sorted(by_signature, key=int.bit_count, reverse=True):
+            if not any(signature & other == signature for other in kept):
+                kept.append(signature)
+        kept = {*kept}
+        instrument.count("trees_equivalent", len(trees) - len(by_signature))
+        instrument.count("trees_dominated", len(by_signature) - len(kept))
+        return [tree for signature, tree in by_signature.items() if signature in kept]
+
+    def get_bound(self, tree: Iterable[int], stats_used: list[str]) -> float:
+        """
+        Get the score of the tree with every optimizable node at the highest level that all the
+        powder of its type affords, which no allocation of the tree can beat since every node
+        is at least as high as in any allocation and no level lowers the score.
+
+        @tree: The IDs of the nodes in the tree.
+        @stats_used: The stats relevant to the optimization.
+        """
+        _, opti_nodes = self.get_node_ids(tree, stats_used)
+        allocation = self.reset(tree)
+        for node in opti_nodes:
+            allocation.levels[node] = bisect_right(
+                NODE_TOTAL_COSTS[node], allocation.get_powder(NODE_COST_TYPES[node]))
+        return self.profile.eval(allocation.levels)
+
+    def find_top_trees(self, trees: list[set[int]], top: int,
+                       workers: int | None = None) -> list[tuple[float, set[int]]]:
+        """
+        Allocate the trees from the highest bound until the next bound cannot beat the last of
+        the best trees, and get the best trees ranked by their optimized score.
+
+        The trees with the same score are ranked in their order like in the full ranking,
+        so the trees with the same bound are allocated in that order too.
+
+        @trees: The trees to rank.
+        @top: Number of best trees to keep.
+        @workers: Number of worker processes, defaults to the CPU count and 1 runs in process.
+        """
+        stats_used = self.get_stats_used()
+        bounds = [self.get_bound(tree, stats_used) for tree in trees]
+        order = sorted(range(len(trees)), key=lambda index: (-bounds[index], index))
+        # The best trees as the score and the negative index, so the smallest is the last one
+        best = []
+        executor = None
+        if workers != 1:
+            workers = workers or os.cpu_count() or 1
+            executor = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                           initargs=(self.profile.config,))
+        try:
+            position = 0
+            while position < len(order):
+                # The bounds only go down in the order, so the rest are skipped at the first miss
+                batch = []
+                for index in order[position:position + (1 if executor is None else workers)]:
+                    if len(best) == top and (bounds[index], -index) <= best[0]:
+                        break
+                    batch.append(index)
+                if len(batch) == 0:
+                    break
+                position += len(batch)
+                if executor is None:
+                    scores = [self.allocate(trees[index]).score for index in batch]
+                else:
+                    scores = executor.map(_allocate_tree, [trees[index] for index in batch])
+                for index, score in zip(batch, scores):
+                    heappush(best, (score, -index))
+                    if len(best) > top:
+                        heappop(best)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        instrument.count("trees_allocated", position)
+        instrument.count("trees_bounded_out", len(trees) - position)
+        return [(score, trees[-neg_index]) for score, neg_index in sorted(best, reverse=True)]
+
+    def print_info(self):
+        self.profile.print_info()
+
+    def get_stats_used(self) -> list[str]:
         if self.profile.mode in ("ores", "exp"):
             stats_used = TASK_STATS[self.profile.ore]
         elif self.profile.mode == "powder":
@@ -422,105 +958,633 @@ class Optimizer:
                     stats_used = TASK_STATS["titanium"]
                 else:
                     stats_used = TASK_STATS[self.profile.powder_type]
-                stats_used.append("powder_gain")
+                # A new list, since appending to the data table would repeat it on every call
+                stats_used = [*stats_used, "powder_gain"]
             else:
                 stats_used = TASK_STATS[f"{self.profile.powder_type}_powder"]
         else:
             raise ValueError(f"unknown mode: {self.profile.mode!r}")
+        return stats_used
 
-        sig_nodes = [pos for pos in tree if len(
-            {*NODE_STATS[to_name(pos)]} & {*stats_used})]
-        sig_names = [to_name(pos) for pos in sig_nodes]
-        print(f"Relevant Stats: {stats_used}")
-        print(f"Significant Nodes: {sig_names}")
-        opti_names = [name for name in sig_names if isinstance(
-            HOTM_PERKS[name], dict) and HOTM_PERKS[name]["type"] == "stat"
-            and "max_level" in HOTM_PERKS[name]]
-        print(f"Optimizable Nodes: {opti_names}")
-        self.levels = defaultdict(int)
-        for pos in tree:
-            self.levels[to_name(pos)] = 1
-
-        self.mithril_powder = self.profile.mithril_powder
-        self.gemstone_powder = self.profile.gemstone_powder
-        self.glacite_powder = self.profile.glacite_powder
-
-        # Check if each powder is sufficient to max the optimizable perks to refine the result
-        mithril_nodes = []
-        gemstone_nodes = []
-        glacite_nodes = []
-        for name in opti_names:
-            if get_cost_type(name) == "mithril":
-                mithril_nodes.append(name)
-            elif get_cost_type(name) == "gemstone":
-                gemstone_nodes.append(name)
-            else:
-                glacite_nodes.append(name)
-        if sum(TOTAL_COSTS[name][-1] for name in mithril_nodes) <= self.mithril_powder:
-            for name in mithril_nodes:
-                self.levels[name] = MAX_LEVELS[name]
-        if sum(TOTAL_COSTS[name][-1] for name in gemstone_nodes) <= self.gemstone_powder:
-            for name in gemstone_nodes:
-                self.levels[name] = MAX_LEVELS[name]
-        if sum(TOTAL_COSTS[name][-1] for name in glacite_nodes) <= self.glacite_powder:
-            for name in glacite_nodes:
-                self.levels[name] = MAX_LEVELS[name]
+    def get_node_ids(self, tree: Iterable[int],
+                     stats_used: list[str]) -> tuple[list[int], list[int]]:
+        """
+        Get the significant and optimizable node IDs of the tree.
+
+        @tree: The IDs of the nodes in the tree.
+        @stats_used: The stats relevant to the optimization.
+        """
+        sig_nodes = [node for node in tree if len(
+            {*NODE_STATS[NODE_NAMES[node]]} & {*stats_used})]
+        # Only the single stat perks with levels have a level delta
+        opti_nodes = [node for node in sig_nodes if NODE_LEVEL_DELTAS[node] is not None]
+        return sig_nodes, opti_nodes
+
+    def reset(self, tree: Iterable[int],
+              powders: tuple[int, int, int] | None = None) -> Allocation:
+        """
+        Get a new allocation of the tree with every node at level 1 and none of the powder spent.
+
+        @tree: The IDs of the nodes in the tree.
+        @powders: The mithril, gemstone and glacite powder to spend, the profile powder if None.
+        """
+        levels = defaultdict(int)
+        for node in tree:
+            levels[node] = 1
+        if powders is None:
+            powders = (self.profile.mithril_powder, self.profile.gemstone_powder,
+                       self.profile.glacite_powder)
+        return Allocation(levels, powders)
+
+    def max_out_pools(self, allocation: Allocation, opti_nodes: list[int]) -> tuple[str, ...]:
+        """
+        Max the optimizable nodes of each powder type if the powder is sufficient for all of them,
+        and return the powder types that are maxed.
+
+        This refines the result since the rest of the powder types are then optimized
+        with the maxed nodes instead of being balanced around them.
+
+        @allocation: The levels and powder to change.
+        @opti_nodes: The optimizable node IDs of the tree.
+        """
+        maxed_types = []
+        for cost_type in ("mithril", "gemstone", "glacite"):
+            nodes = [node for node in opti_nodes if NODE_COST_TYPES[node] == cost_type]
+            total_cost = sum(NODE_TOTAL_COSTS[node][-1] -
+                             NODE_TOTAL_COSTS[node][allocation.levels[node] - 1] for node in nodes)
+            if len(nodes) == 0 or total_cost > allocation.get_powder(cost_type):
+                continue
+            for node in nodes:
+                allocation.levels[node] = NODE_MAX_LEVELS[node]
+            allocation.spend(cost_type, total_cost)
+            maxed_types.append(cost_type)
+        return tuple(maxed_types)
+
+    @timed("allocate")
+    def allocate(self, tree: Iterable[int],
+                 opti_nodes: list[int] | None = None, lazy: bool = False,
+                 bulk: bool = False) -> Allocation:
+        """
+        Spend the powder on the tree with the greedy purchases and get the allocation
+        with the levels, the leftover powder and the score.
+
+        @tree: The IDs of the nodes in the tree.
+        @opti_nodes: The optimizable node IDs, found from the tree if None.
+        @lazy: Whether to only re-score the candidate on top of a heap of the last known
+            ratios instead of every candidate, which may differ from the exhaustive scan.
+        @bulk: Whether to buy all the affordable levels of the last affordable node in one step
+            instead of one level for each scan, which only works with the exhaustive scan.
+        """
+        if lazy and bulk:
+            raise ValueError("lazy and bulk purchases cannot be used together")
+        if opti_nodes is None:
+            _, opti_nodes = self.get_node_ids(tree, self.get_stats_used())
+        allocation = self.reset(tree)
+        self.max_out_pools(allocation, opti_nodes)
+        allocation.score = self.purchase(allocation, opti_nodes, lazy, bulk)
+        return allocation
+
+    @timed("purchase")
+    def purchase(self, allocation: Allocation, opti_nodes: list[int], lazy: bool = False,
+                 bulk: bool = False, purchases: list[tuple[int, int, int]] | None = None) -> float:
+        """
+        Make the greedy purchases from the levels of the allocation until no node is affordable,
+        and return the score.
+
+        @allocation: The levels and powder to change.
+        @opti_nodes: The optimizable node IDs of the tree.
+        @lazy: Whether to only re-score the candidate on top of a heap of the last known ratios.
+        @bulk: Whether to buy all the affordable levels of the last affordable node in one step.
+        @purchases: The list to record each purchase to as the node ID, level count and cost.
+        """
+        levels = allocation.levels
+        # Keep the stat totals and only apply the stat delta of each purchase
+        score = self.profile.compile()
+        stats = self.profile.get_stats(levels)
+        great_explorer_level = levels.get(GREAT_EXPLORER, 0)
+        current_score = score(stats, great_explorer_level)
+
+        def bump_score(node: int) -> float:
+            stat, delta = NODE_LEVEL_DELTAS[node]
+            total = stats[stat]
+            stats[stat] = total + delta
+            new_score = score(stats, great_explorer_level + (node == GREAT_EXPLORER))
+            stats[stat] = total
+            return new_score
+
+        # The heap holds the last known ratio, cost and iteration of each candidate
+        heap = []
+        # The number of candidate purchases scored
+        checks = 0
+        if lazy:
+            for index, node in enumerate(opti_nodes):
+                affordable, cost = allocation.can_afford_and_cost(node)
+                if affordable:
+                    ratio = (bump_score(node) - current_score) / cost
+                    heap.append((-ratio, index, cost, 0))
+                    checks += 1
+            heapify(heap)
 
         i = 0
         while True:
-            pairs = [(name, pair[1]) for name in opti_names
-                     if (pair := self.can_afford_and_cost(name))[0]]
-            if len(pairs) == 0:
-                break
-            current_score = self.profile.eval(self.levels)
-            best_name = None
-            best_ratio = -inf
-            best_cost = 0
-            for name, cost in pairs:
-                new_levels = self.levels.copy()
-                new_levels[name] += 1
-                new_score = self.profile.eval(new_levels)
-                ratio = (new_score - current_score) / cost
-                if ratio > best_ratio:
-                    best_name = name
-                    best_ratio = ratio
-                    best_cost = cost
-            if best_ratio < 0 or best_name is None:
-                print(f"{best_name=}")
-                print(f"{best_ratio=}")
-                print(f"{best_cost=}")
-                raise ValueError("something is wrong and the"
-                                 " best purchase hurts score")
-            self.levels[best_name] += 1
-            cost_type = get_cost_type(best_name)
-            # print(best_name, cost_type)
-            if cost_type == "mithril":
-                self.mithril_powder -= best_cost
-            elif cost_type == "gemstone":
-                self.gemstone_powder -= best_cost
+            if lazy:
+                # Re-score the top entry until a fresh one stays on top
+                best_node = None
+                while len(heap) > 0:
+                    neg_ratio, index, cost, scored_at = heappop(heap)
+                    node = opti_nodes[index]
+                    if scored_at == i:
+                        best_node = node
+                        best_ratio = -neg_ratio
+                        best_cost = cost
+                        best_score = current_score + best_ratio * cost
+                        break
+                    # The powder only goes down, so an unaffordable node stays unaffordable
+                    if allocation.can_afford_and_cost(node)[0]:
+                        ratio = (bump_score(node) - current_score) / cost
+                        heappush(heap, (-ratio, index, cost, i))
+                        checks += 1
+                if best_node is None:
+                    break
             else:
-                self.glacite_powder -= best_cost
+                pairs = [(node, pair[1]) for node in opti_nodes
+                         if (pair := allocation.can_afford_and_cost(node))[0]]
+                if len(pairs) == 0:
+                    break
+                new_scores = [bump_score(node) for node, _ in pairs]
+                checks += len(pairs)
+                best_node = None
+                best_ratio = -inf
+                best_cost = 0
+                best_score = current_score
+                for (node, cost), new_score in zip(pairs, new_scores):
+                    ratio = (new_score - current_score) / cost
+                    if ratio > best_ratio:
+                        best_node = node
+                        best_ratio = ratio
+                        best_cost = cost
+                        best_score = new_score
+            if best_ratio < 0 or best_node is None:
+                raise ValueError(f"something is wrong and the best purchase hurts score:"
+                                 f" {best_node=}, {best_ratio=}, {best_cost=}")
+            count = 1
+            if bulk and len(pairs) == 1:
+                # The other nodes stay unaffordable as the powder only goes down,
+                # so every affordable level of the only candidate would be bought
+                count = allocation.count_affordable_levels(best_node)
+            level = levels[best_node]
+            levels[best_node] += count
+            stat, delta = NODE_LEVEL_DELTAS[best_node]
+            for _ in range(count):
+                stats[stat] += delta
+            if best_node == GREAT_EXPLORER:
+                great_explorer_level += count
+            if count == 1:
+                current_score = best_score
+            else:
+                current_score = score(stats, great_explorer_level)
+                best_cost = NODE_TOTAL_COSTS[best_node][level - 1 + count] - \
+                    NODE_TOTAL_COSTS[best_node][level - 1]
+            allocation.spend(NODE_COST_TYPES[best_node], best_cost)
+            if purchases is not None:
+                purchases.append((best_node, count, best_cost))
             i += 1
-        levels_items = [(name, level) for name, level in self.levels.items()]
-        print('\n')
-        print('-' * 20 + " Tree Used " + '-' * 20)
-        print_tree_coords(tree)
-        print('-' * 20 + " Results " + '-' * 20)
-        for name, level in sorted(levels_items, key=lambda pair: NODE_NAMES.index(pair[0])):
-            if name in opti_names:
-                print(f" - {snake_to_title(name)}: {level}")
-        result_eval = self.profile.eval(self.levels)
+            if lazy:
+                affordable, cost = allocation.can_afford_and_cost(best_node)
+                if affordable:
+                    ratio = (bump_score(best_node) - current_score) / cost
+                    heappush(heap, (-ratio, opti_nodes.index(best_node), cost, i))
+                    checks += 1
+        instrument.count("greedy_iterations", i)
+        instrument.count("candidate_checks", checks)
+        return self.profile.eval(levels)
+
+    @timed("get_purchase_sequence")
+    def get_purchase_sequence(self, tree: Iterable[int], opti_nodes: list[int],
+                              maxed_types: tuple[str, ...]) -> tuple[list[int], dict[str, list[int]]]:
+        """
+        Get the greedy purchases of the tree with unlimited powder, and the total powder
+        of each type spent after each purchase, cached for the tree and maxed powder types.
+
+        @tree: The IDs of the nodes in the tree.
+        @opti_nodes: The optimizable node IDs of the tree.
+        @maxed_types: The powder types with their nodes maxed before the purchases.
+        """
+        key = (tuple(sorted(tree)), maxed_types)
+        if key in self.purchase_sequences:
+            return self.purchase_sequences[key]
+        allocation = self.reset(tree, (inf, inf, inf))
+        for node in opti_nodes:
+            if NODE_COST_TYPES[node] in maxed_types:
+                allocation.levels[node] = NODE_MAX_LEVELS[node]
+        purchases = []
+        self.purchase(allocation, opti_nodes, purchases=purchases)
+
+        nodes = []
+        spent = {"mithril": [], "gemstone": [], "glacite": []}
+        totals = dict.fromkeys(spent, 0)
+        for node, _, cost in purchases:
+            nodes.append(node)
+            totals[NODE_COST_TYPES[node]] += cost
+            for cost_type, total in totals.items():
+                spent[cost_type].append(total)
+        self.purchase_sequences[key] = nodes, spent
+        return nodes, spent
+
+    @timed("allocate_indexed")
+    def allocate_indexed(self, tree: Iterable[int], opti_nodes: list[int] | None = None,
+                         powders: tuple[int, int, int] | None = None) -> Allocation:
+        """
+        Spend the powder on the tree with the same purchases as the greedy allocate and
+        get the allocation, looking up the purchases up to the first unaffordable one
+        in the purchase sequence of the tree instead of scoring them.
+
+        Every purchase in the sequence before the first one that the powder cannot afford
+        is also the best affordable one, so only the purchases after it are scored.
+
+        @tree: The IDs of the nodes in the tree.
+        @opti_nodes: The optimizable node IDs, found from the tree if None.
+        @powders: The mithril, gemstone and glacite powder to spend, the profile powder if None.
+        """
+        if opti_nodes is None:
+            _, opti_nodes = self.get_node_ids(tree, self.get_stats_used())
+        allocation = self.reset(tree, powders)
+        maxed_types = self.max_out_pools(allocation, opti_nodes)
+        nodes, spent = self.get_purchase_sequence(tree, opti_nodes, maxed_types)
+
+        # The total spent of each type only goes up, so the prefix for each type is a bisection
+        count = min(bisect_right(totals, allocation.get_powder(cost_type))
+                    for cost_type, totals in spent.items())
+        for node in nodes[:count]:
+            allocation.levels[node] += 1
+        if count > 0:
+            for cost_type, totals in spent.items():
+                allocation.spend(cost_type, totals[count - 1])
+        allocation.score = self.purchase(allocation, opti_nodes)
+        return allocation
+
+    def get_level_choices(self, nodes: list[int], budget: int,
+                          start_levels: list[int] | None = None,
+                          next_cost: float = inf) -> list[tuple[int, ...]]:
+        """
+        Get every way to level the nodes of one powder type as far as the powder goes.
+
+        The last node takes all the levels the powder left affords, and the choices with
+        enough powder left for another level of any node are dropped since no level lowers the score.
+
+        @nodes: The node IDs of the same powder type.
+        @budget: The powder of the type to spend.
+        @start_levels: The levels of the nodes already bought, all level 1 if None.
+        @next_cost: The cheapest next level of the nodes of the type leveled before these.
+        """
+        if len(nodes) == 0:
+            return [()]
+        if start_levels is None:
+            start_levels = [1] * len(nodes)
+        # The levels already bought are counted as spent from the budget
+        budget += sum(NODE_TOTAL_COSTS[node][level - 1] for node, level in zip(nodes, start_levels))
+        choices = []
+
+        def extend(index: int, budget: int, prefix: tuple[int, ...], next_cost: float):
+            costs = NODE_TOTAL_COSTS[nodes[index]]
+            max_level = bisect_right(costs, budget)
+            if index == len(nodes) - 1:
+                if max_level >= start_levels[index] and budget - costs[max_level - 1] < next_cost:
+                    choices.append(prefix + (max_level,))
+                return
+            for level in range(start_levels[index], max_level + 1):
+                if level < len(costs):
+                    cost = min(next_cost, costs[level] - costs[level - 1])
+                else:
+                    cost = next_cost
+                extend(index + 1, budget - costs[level - 1], prefix + (level,), cost)
+
+        extend(0, budget, (), next_cost)
+        return choices
+
+    def get_level_branch(self, nodes: list[int], start_levels: list[int],
+                         prefix: tuple[int, ...], budget: int, next_cost: float = inf
+                         ) -> tuple[tuple[int, ...], int, float, list[int]]:
+        """
+        Get a branch of the search of allocate_exact over the levels of one powder type, which is
+        the levels of the first nodes, the powder left, the cheapest next level of those nodes,
+        and the highest level of every node in the branch.
+
+        A node after the first ones can at most take the powder left with the others at their
+        start levels, which bounds the score of every choice in the branch.
+
+        @nodes: The node IDs of the same powder type.
+        @start_levels: The levels of the nodes already bought.
+        @prefix: The levels of the first nodes, or () for every choice.
+        @budget: The powder of the type left, with the levels bought of the other nodes not spent.
+        @next_cost: The cheapest next level of the first nodes.
+        """
+        rest = [*zip(nodes[len(prefix):], start_levels[len(prefix):])]
+        kept = sum(NODE_TOTAL_COSTS[node][level - 1] for node, level in rest)
+        tops = [*prefix, *(bisect_right(NODE_TOTAL_COSTS[node],
+                                        budget - kept + NODE_TOTAL_COSTS[node][level - 1])
+                           for node, level in rest)]
+        return prefix, budget, next_cost, tops
+
+    def get_level_branches(self, nodes: list[int], start_levels: list[int],
+                           branch: tuple[tuple[int, ...], int, float, list[int]]
+                           ) -> list[tuple[tuple[int, ...], int, float, list[int]]]:
+        """
+        Get the branches of a branch with every level of its next node that the powder affords.
+
+        @nodes: The node IDs of the same powder type.
+        @start_levels: The levels of the nodes already bought.
+        @branch: The branch from get_level_branch.
+        """
+        prefix, budget, next_cost, _ = branch
+        index = len(prefix)
+        costs = NODE_TOTAL_COSTS[nodes[index]]
+        # The nodes after this one keep the levels already bought
+        kept = sum(NODE_TOTAL_COSTS[node][level - 1]
+                   for node, level in zip(nodes[index + 1:], start_levels[index + 1:]))
+        branches = []
+        for level in range(start_levels[index], bisect_right(costs, budget - kept) + 1):
+            if level < len(costs):
+                cost = min(next_cost, costs[level] - costs[level - 1])
+            else:
+                cost = next_cost
+            branches.append(self.get_level_branch(
+                nodes, start_levels, prefix + (level,), budget - costs[level - 1], cost))
+        return branches
+
+    @timed("allocate_exact")
+    def allocate_exact(self, tree: Iterable[int],
+                       opti_nodes: list[int] | None = None) -> Allocation:
+        """
+        Spend the powder on the tree for the best score with a branch and bound search,
+        and get the allocation.
+
+        Each powder type is its own budget, so the level choices of each type are listed apart.
+        The type with the most nodes is searched for each combination of the choices of the rest,
+        as branches by the levels of its first nodes that are bounded in batches a node at a time.
+        A branch is skipped if the score with its nodes at their highest levels in the branch is
+        no better than the best found, and the branches and choices under it are only listed
+        once it is not skipped. The choices of the other types are all listed, so a tree with
+        many optimizable nodes of more than one powder type can still take seconds.
+        The greedy allocation is the starting best, and its score is kept as greedy_score
+        to see how far it falls from the optimum.
+
+        @tree: The IDs of the nodes in the tree.
+        @opti_nodes: The optimizable node IDs, found from the tree if None.
+        """
+        if opti_nodes is None:
+            _, opti_nodes = self.get_node_ids(tree, self.get_stats_used())
+        allocation = self.reset(tree)
+        allocation.score = self.search_exact(allocation, opti_nodes)
+        return allocation
+
+    @timed("search_exact")
+    def search_exact(self, allocation: Allocation, opti_nodes: list[int]) -> float:
+        """
+        Spend the powder left on the levels of the allocation for the best score with the branch
+        and bound search of allocate_exact, never lowering a level, and return the score.
+
+        @allocation: The levels and powder to change.
+        @opti_nodes: The optimizable node IDs of the tree.
+        """
+        start_levels = allocation.levels.copy()
+        start_powders = allocation.powders
+        greedy = allocation.copy()
+        self.max_out_pools(greedy, opti_nodes)
+        allocation.greedy_score = best_score = self.purchase(greedy, opti_nodes)
+        best_levels = greedy.levels
+        self.max_out_pools(allocation, opti_nodes)
+
+        groups = []
+        for cost_type in ("mithril", "gemstone", "glacite"):
+            nodes = [node for node in opti_nodes if NODE_COST_TYPES[node] == cost_type
+                     and allocation.levels[node] < NODE_MAX_LEVELS[node]]
+            if len(nodes) > 0:
+                groups.append((nodes, allocation.get_powder(cost_type),
+                               [allocation.levels[node] for node in nodes]))
+
+        if len(groups) > 0:
+            # The choices grow the fastest with the nodes, so the type with the most is batched
+            groups.sort(key=lambda group: len(group[0]))
+            batch_nodes, batch_budget, batch_starts = groups.pop()
+            groups = [(nodes, self.get_level_choices(nodes, budget, starts))
+                      for nodes, budget, starts in groups]
+            fixed_nodes = [node for node in allocation.levels if node not in batch_nodes]
+            nodes = batch_nodes + fixed_nodes
+
+            def get_scores(choices: list, fixed_levels: list[int]):
+                if np is None:
+                    matrix = [[*levels, *fixed_levels] for levels in choices]
+                else:
+                    matrix = np.empty((len(choices), len(nodes)), dtype=int)
+                    matrix[:, :len(batch_nodes)] = choices
+                    matrix[:, len(batch_nodes):] = fixed_levels
+                return self.profile.eval_batch(nodes, matrix)
+
+            # The levels already bought are counted as spent from the budget
+            batch_budget += sum(NODE_TOTAL_COSTS[node][level - 1]
+                                for node, level in zip(batch_nodes, batch_starts))
+            root = self.get_level_branch(batch_nodes, batch_starts, (), batch_budget)
+            split = max(0, len(batch_nodes) - 2)
+            # The branches of each branch, or the choices of a branch of all but the last
+            # two nodes, by the levels of its first nodes, listed when it is first not skipped
+            expanded = {}
+
+            def expand(branch) -> list:
+                prefix, budget, next_cost, _ = branch
+                if prefix not in expanded:
+                    if len(prefix) < split:
+                        expanded[prefix] = self.get_level_branches(batch_nodes, batch_starts, branch)
+                    else:
+                        kept = sum(NODE_TOTAL_COSTS[node][level - 1] for node, level in
+                                   zip(batch_nodes[split:], batch_starts[split:]))
+                        expanded[prefix] = [prefix + levels for levels in self.get_level_choices(
+                            batch_nodes[split:], budget - kept, batch_starts[split:], next_cost)]
+                return expanded[prefix]
+
+            combos = pruned_combos = pruned_branches = 0
+            for choice in product(*(choices for _, choices in groups)):
+                combos += 1
+                for (group_nodes, _), levels in zip(groups, choice):
+                    allocation.levels.update(zip(group_nodes, levels))
+                # Bound with the batched nodes at their highest levels in any choice
+                allocation.levels.update(zip(batch_nodes, root[3]))
+                if self.profile.eval(allocation.levels) <= best_score:
+                    pruned_combos += 1
+                    continue
+                fixed_levels = [allocation.levels[node] for node in fixed_nodes]
+                # The branches are bounded a node at a time, so only the levels of the ones
+                # better than the best found are listed
+                branches = [root]
+                while len(branches) > 0 and len(branches[0][0]) < split:
+                    branches = [child for branch in branches for child in expand(branch)]
+                    bounds = get_scores([tops for *_, tops in branches], fixed_levels)
+                    pruned_branches += sum(1 for bound in bounds if bound <= best_score)
+                    branches = [branch for branch, bound in zip(branches, bounds)
+                                if bound > best_score]
+                choices = [levels for branch in branches for levels in expand(branch)]
+                if len(choices) == 0:
+                    continue
+                scores = get_scores(choices, fixed_levels)
+                index = max(range(len(choices)), key=scores.__getitem__)
+                if scores[index] > best_score:
+                    best_score = float(scores[index])
+                    best_levels = allocation.levels.copy()
+                    best_levels.update(zip(batch_nodes, choices[index]))
+            instrument.count("exact_combinations", combos)
+            instrument.count("exact_combinations_pruned", pruned_combos)
+            instrument.count("exact_branches_pruned", pruned_branches)
+
+        allocation.levels = best_levels
+        allocation.powders = start_powders
+        for node in opti_nodes:
+            costs = NODE_TOTAL_COSTS[node]
+            allocation.spend(NODE_COST_TYPES[node],
+                       costs[allocation.levels[node] - 1] - costs[start_levels[node] - 1])
+        return best_score
+
+    @timed("resume")
+    def resume(self, levels: dict[int, int], powders: tuple[int, int, int],
+               opti_nodes: list[int] | None = None, lazy: bool = False, bulk: bool = False,
+               exact: bool = False) -> tuple[Allocation, dict[int, int]]:
+        """
+        Spend more powder on a tree already leveled, like after powder is gained while mining,
+        and get the allocation with the levels bought on each node.
+
+        The search goes on from the given levels instead of from level 1, so only the new
+        purchases are scored, and the levels are never lowered, unlike in a new allocation.
+
+        @levels: The levels of the nodes in the tree by ID.
+        @powders: The mithril, gemstone and glacite powder left to spend.
+        @opti_nodes: The optimizable node IDs, found from the tree if None.
+        @lazy: Whether to only re-score the candidate on top of a heap of the last known ratios.
+        @bulk: Whether to buy all the affordable levels of the last affordable node in one step.
+        @exact: Whether to search for the best levels instead of the greedy purchases.
+        """
+        if lazy and bulk:
+            raise ValueError("lazy and bulk purchases cannot be used together")
+        tree = [node for node, level in levels.items() if level > 0]
+        if opti_nodes is None:
+            _, opti_nodes = self.get_node_ids(tree, self.get_stats_used())
+        allocation = self.reset(tree, powders)
+        allocation.levels.update((node, levels[node]) for node in tree)
+        if exact:
+            allocation.score = self.search_exact(allocation, opti_nodes)
+        else:
+            self.max_out_pools(allocation, opti_nodes)
+            allocation.score = self.purchase(allocation, opti_nodes, lazy, bulk)
+        bought = {node: allocation.levels[node] - levels[node] for node in tree
+                  if allocation.levels[node] > levels[node]}
+        return allocation, bought
+
+    def get_fingerprint(self, tree: Iterable[int] | None = None,
+                        options: tuple[bool, ...] = ()) -> tuple:
+        """
+        Get the values that the optimize result depends on, with the tree searched
+        from the HOTM level and tokens if no tree is given or in the config.
+
+        The sizes and modification times of the code and data files are included,
+        so any change to them leaves the old results unused.
+
+        @tree: The IDs of the nodes in the tree, the config tree or a searched one if None.
+        @options: The options of the allocation.
+        """
+        if tree is not None:
+            tree = ("tree", *sorted(node for node in tree if node != CORE_OF_THE_MOUNTAIN))
+        elif self.profile.given_tree is not None:
+            tree = ("tree", *sorted(to_id(name) for name in self.profile.given_tree
+                                    if name != "core_of_the_mountain"))
+        else:
+            tree = ("search", self.profile.hotm, self.profile.tokens, self.profile.force_ability,
+                    tuple(sorted(self.get_required_nodes())))
+        sources = [*get_source_stats().items()]
+        for module_name in ("optimizer.py", "pathfind.py"):
+            path = join(dirname(__file__), module_name)
+            info = os.stat(path)
+            sources.append((path, (info.st_size, info.st_mtime_ns)))
+        powders = (self.profile.mithril_powder, self.profile.gemstone_powder,
+                   self.profile.glacite_powder)
+        return (tree, options, powders, tuple(sorted({*self.get_stats_used()})),
+                self.profile.get_fingerprint(), tuple(sorted(sources)))
+
+    @timed("optimize")
+    def optimize(self, tree: Iterable[int] | None = None,
+                 lazy: bool = False, bulk: bool = False, exact: bool = False,
+                 indexed: bool = False, workers: int | None = None,
+                 top: int | None = TOP_TREES) -> OptimizeResult:
+        """
+        Optimize the levels of a tree and get the result, which render.print_result prints.
+
+        @tree: The IDs of the nodes in the tree, the config tree or the best searched one if None.
+        @lazy: Whether to use the lazy greedy purchases.
+        @bulk: Whether to use the bulk greedy purchases.
+        @exact: Whether to search for the best levels instead of the greedy purchases.
+        @indexed: Whether to look up the greedy purchases in the purchase sequence of the tree.
+        @workers: Number of worker processes of the tree search, defaults to the CPU count.
+        @top: Number of best trees to rank in the tree search, all trees are ranked if None.
+        """
+        key = None
+        if self.cache is not None:
+            key = get_key(self.get_fingerprint(tree, (lazy, bulk, exact, indexed, top)))
+            values = self.cache.get(key)
+            instrument.count("cache_misses" if values is None else "cache_hits")
+            if values is not None:
+                # The target is not in the fingerprint, so its time is found again
+                result = OptimizeResult(*values)
+                result.time_to_target = self.profile.get_time_to_target(result.score)
+                return result
+
+        ranked = []
+        if tree is None:
+            if self.profile.given_tree is None:
+                # The search is the same for every call, so it is only done once
+                # unless more trees are ranked
+                ranked_trees, ranked_top = self.ranking
+                if len(ranked_trees) > 0 and (
+                        ranked_top is None or top is not None and top <= ranked_top):
+                    ranked = ranked_trees[:top]
+                else:
+                    ranked = self.find_trees(workers, top)
+                tree = tuple(node for node in ranked[0][1]
+                             if node != CORE_OF_THE_MOUNTAIN)
+            else:
+                tree = {to_id(name) for name in self.profile.given_tree}
+        else:
+            tree = tuple(node for node in tree
+                         if node != CORE_OF_THE_MOUNTAIN)
+            if len(tree) > self.profile.tokens:
+                raise ValueError(f"tokens not enough to build this tree: "
+                                 f"{len(tree)}>{self.profile.tokens}")
+        stats_used = self.get_stats_used()
+        sig_nodes, opti_nodes = self.get_node_ids(tree, stats_used)
+        if exact:
+            allocation = self.allocate_exact(tree, opti_nodes)
+        elif indexed:
+            allocation = self.allocate_indexed(tree, opti_nodes)
+        else:
+            allocation = self.allocate(tree, opti_nodes, lazy, bulk)
+        score = allocation.score
+
         if self.profile.mode == "powder":
-            mode_str = snake_to_title(f"{self.profile.powder_type}_powder")
+            unit = f"{self.profile.powder_type}_powder"
         else:
-            mode_str = snake_to_title(self.ore)
-        print(f"Optimized Efficiency: {result_eval:.2f} {mode_str} per minute.\n"
-              f"                    : {result_eval*60:.2f} {mode_str} per hour.")
-        print('-' * 20 + " Powder Left " + '-' * 20)
-        print(f" - Mithril Powder: {self.mithril_powder}")
-        print(f" - Gemstone Powder: {self.gemstone_powder}")
-        print(f" - Glacite Powder: {self.glacite_powder}")
-        if self.profile.target_amount is not None:
-            time = floor(self.profile.target_amount /
-                         result_eval * 60)  # in seconds
-            print('-' * 20 + " Time Estimation " + '-' * 20)
+            unit = self.profile.ore
+        result = OptimizeResult(
+            unit, [*stats_used], tuple(sorted(tree)), tuple(sig_nodes), tuple(opti_nodes),
+            {node: level for node, level in allocation.levels.items() if level > 0}, float(score),
+            {"mithril": allocation.mithril_powder, "gemstone": allocation.gemstone_powder,
+             "glacite": allocation.glacite_powder}, self.profile.get_time_to_target(score),
+            float(allocation.greedy_score) if exact else None,
+            [(float(tree_score), tuple(sorted(tree))) for tree_score, tree in ranked])
+        if self.cache is not None:
+            self.cache.put(key, astuple(replace(result, time_to_target=None)))
+        return result
+
+
+def _init_worker(config):
+    global _WORKER_OPTIMIZER
+    _WORKER_OPTIMIZER = Optimizer(config)
+
+
+def _allocate_tree(tree: set[int]) -> float:
+    return _WORKER_OPTIMIZER.allocate(tree).score
@@ -1,112 +1,418 @@
-from collections import deque
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Iterable
 
+import instrument
 from data import *
+from instrument import timed
 
 
-Node = tuple[int, int]
-Path = tuple[Node]
-PATHS: dict[Node, list[Path]] = {
-    (0, 3): [((0, 3),)], (1, 3): [((1, 3), (0, 3))]}
-ENDPOINT = (0, 3)
-for start in HOTM_TAKEN:
+# The IDs of the adjacent nodes of each node by its ID
+NEIGHBORS: list[list[int]] = [
+    [HOTM_TAKEN.index(nextup) for nextup in ((hi + 1, hj), (hi, hj + 1), (hi - 1, hj), (hi, hj - 1))
+     if nextup in HOTM_TAKEN]
+    for hi, hj in HOTM_TAKEN]
+
+
+def to_mask(nodes: Iterable[int]) -> int:
+    """
+    Get the bitmask of the node IDs, which are the bit indices since the tree has less than 64 nodes.
+
+    @nodes: The IDs of the nodes.
+    """
+    mask = 0
+    for node in nodes:
+        mask |= 1 << node
+    return mask
+
+
+def to_ids(mask: int) -> set[int]:
+    """
+    Get the node IDs of the bitmask.
+
+    @mask: The bitmask of the nodes.
+    """
+    ids = {*()}
+    while mask:
+        bit = mask & -mask
+        ids.add(bit.bit_length() - 1)
+        mask ^= bit
+    return ids
+
+
+def get_rows_mask(hotm: int) -> int:
+    """
+    Get the bitmask of all the nodes in reach of the HOTM level.
+
+    @hotm: The HOTM level limiting the rows that can be used.
+    """
+    return to_mask(node for node, (row, _) in enumerate(HOTM_TAKEN) if row < hotm)
+
+
+ENDPOINT = HOTM_TAKEN.index((0, 3))
+CORE_OF_THE_MOUNTAIN = HOTM_TAKEN.index((4, 3))
+_ABOVE_ENDPOINT = HOTM_TAKEN.index((1, 3))
+# The paths of each node ID to the endpoint, filled in by get_paths when first needed
+PATHS: dict[int, list[int]] = {
+    ENDPOINT: [1 << ENDPOINT], _ABOVE_ENDPOINT: [1 << _ABOVE_ENDPOINT | 1 << ENDPOINT]}
+
+
+def get_paths(start: int) -> list[int]:
+    """
+    Get the bitmasks of all the paths from the node to the endpoint, memoized in PATHS.
+
+    @start: The ID of the node to start from.
+    """
     if start in PATHS:
-        continue
+        return PATHS[start]
+    if not 0 <= start < len(HOTM_TAKEN):
+        return []
     valid_paths = {*()}
-    paths_deque = deque(((start,),))
+    paths_deque = deque(((start, 1 << start),))
     while len(paths_deque) > 0:
-        path = paths_deque.popleft()
-        head = path[-1]
-        hi, hj = head
-        for nextup in ((hi + 1, hj), (hi, hj + 1), (hi - 1, hj), (hi, hj - 1)):
-            if nextup in HOTM_TAKEN and nextup not in path:
+        head, path = paths_deque.popleft()
+        for nextup in NEIGHBORS[head]:
+            if not path >> nextup & 1:
                 if nextup == ENDPOINT:
-                    valid_paths.add(path + (nextup,))
-                elif nextup in PATHS:
-                    for continuation in PATHS[nextup]:
-                        if len({*path} & {*continuation}) == 0:
-                            valid_paths.add(path + continuation)
+                    valid_paths.add(path | 1 << nextup)
+                # Continue with the paths of the nodes before the start, so the recursion ends
+                elif nextup in PATHS or nextup < start:
+                    for continuation in get_paths(nextup):
+                        if not path & continuation:
+                            valid_paths.add(path | continuation)
                 else:
-                    paths_deque.append(path + (nextup,))
+                    paths_deque.append((nextup, path | 1 << nextup))
     PATHS[start] = sorted(valid_paths)
+    instrument.count("paths_built")
+    return PATHS[start]
+
+
+class SubsetTrie:
+    """
+    Antichain of masks where no mask is a subset of another, kept as a trie on their bits.
+
+    The masks must be added in the order of their bit counts, so that a mask
+    never has to replace a superset that was added before it.
+    """
 
+    def __init__(self):
+        # Each node maps the next bit to its child, and 0 to the mask ending there
+        self.root = {}
+        self.masks = []
 
-def smart_union(*groups, max_len: int = 0):
+    def has_subset(self, mask: int) -> bool:
+        """
+        Check if any mask in the trie is a subset of the mask.
+
+        @mask: The bitmask to check.
+        """
+        stack = [self.root]
+        while len(stack) > 0:
+            node = stack.pop()
+            if 0 in node:
+                return True
+            # Only follow the bits in the mask, where the ending key 0 never matches
+            for bit, child in node.items():
+                if bit & mask:
+                    stack.append(child)
+        return False
+
+    def add(self, mask: int) -> bool:
+        """
+        Add the mask if no mask in the trie is a subset of it, and return whether it is added.
+
+        @mask: The bitmask to add, with no fewer bits than any mask added before.
+        """
+        if self.has_subset(mask):
+            return False
+        node = self.root
+        bits = mask
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            node = node.setdefault(bit, {})
+        node[0] = mask
+        self.masks.append(mask)
+        return True
+
+
+def get_minimal_masks(masks: Iterable[int]) -> list[int]:
     """
-    Recursively finds all minimal-cost union combinations of paths.
+    Get the masks that have no other mask as a subset, sorted by their bit counts.
+
+    @masks: The bitmasks to filter, where duplicates are kept once.
+    """
+    trie = SubsetTrie()
+    for mask in sorted({*masks}, key=int.bit_count):
+        trie.add(mask)
+    return trie.masks
+
+
+def smart_union(*groups, max_len: int = 0) -> list[int]:
+    """
+    Recursively finds all minimal-cost union combinations of path masks.
     """
     if not groups:
         return []
 
-    # Base case: If only one group left, filter by max_len
+    # A path with another path of the group as a subset only leads to supersets of its unions,
+    # so only the minimal paths of each group are merged
+    first_group = get_minimal_masks(mask for mask in groups[0] if mask.bit_count() <= max_len)
+
+    # Base case: If only one group left, the minimal paths are the unions
     if len(groups) == 1:
-        return [set(g) for g in groups[0] if len(g) <= max_len]
+        return first_group
 
-    # Recursive step
-    result_sets = []
     # Get results from the rest of the groups first
     sub_results = smart_union(*groups[1:], max_len=max_len)
 
-    for group1_item in groups[0]:
-        # Optimization: if the first item alone is too long, skip
-        if len(group1_item) > max_len:
-            continue
-        for group2_item_set in sub_results:
-            merged_set = set(group1_item) | group2_item_set
-            if len(merged_set) <= max_len:
-                result_sets.append(merged_set)
-
-    # Pruning logic: Remove any path that is a superset of another valid path
-    unique_sets = {tuple(sorted(list(s))) for s in result_sets}
-    minimal_sets = []
-    for s_tuple in unique_sets:
-        s_set = set(s_tuple)
-        is_minimal = True
-        for other_tuple in unique_sets:
-            if s_tuple != other_tuple and set(other_tuple).issubset(s_set):
-                is_minimal = False
-                break
-        if is_minimal:
-            minimal_sets.append(s_set)
-
-    return minimal_sets
-
-
-def union_pathfind(nodes: set[tuple[int, int]], hotm: int, tokens: int):
-    """
-    Finds all valid HotM trees for a given set of desired nodes.
-    (Corrected Version)
-    """
-    # This function requires a pre-computed PATHS dictionary, which is not defined
-    # in the provided snippets. Assuming it exists and maps a node to its possible paths.
-    # For now, this will raise an error unless PATHS is defined elsewhere.
-    if 'PATHS' not in globals():
-        print("Error: PATHS dictionary not found. Pathfinding cannot proceed.")
+    merged_masks = (group1_mask | group2_mask for group1_mask in first_group
+                    for group2_mask in sub_results)
+    # Pruning logic: Drop any union that is a superset of another valid union
+    return get_minimal_masks(mask for mask in merged_masks if mask.bit_count() <= max_len)
+
+
+# The node counts of all the nodes are packed in an integer with a byte for each node,
+# so each split of the terminals is added and compared for every node at once
+UNREACHABLE = 63
+LANES_ONE = int.from_bytes(bytes([1] * len(HOTM_TAKEN)), "little")
+LANES_HIGH = LANES_ONE << 7
+LANES_UNREACHABLE = LANES_ONE * UNREACHABLE
+
+
+def get_lane(costs: int, node: int) -> int:
+    """
+    Get the node count of a node from the packed node counts.
+
+    @costs: The node counts packed with a byte for each node.
+    @node: The bit index of the node.
+    """
+    return costs >> (node << 3) & 0xFF
+
+
+# The node counts of each terminal subset by the allowed nodes and the limit,
+# shared by the searches of different node sets, with the least recently used
+# tables removed so that a long running process does not keep every HOTM level and token count
+STEINER_COSTS: OrderedDict[tuple[int, int], dict[int, int]] = OrderedDict()
+# The most tables kept in STEINER_COSTS, where a search uses one of tens of thousands of entries
+STEINER_TABLES = 4
+# The most results of get_steiner_trees kept, where a search uses a few hundred
+STEINER_TREES = 1 << 14
+
+
+def clear_steiner_caches():
+    """
+    Remove the node counts and trees kept from the earlier Steiner searches.
+    """
+    STEINER_COSTS.clear()
+    get_steiner_trees.cache_clear()
+
+
+def get_root_distances(allowed: int) -> list[int]:
+    """
+    Get the number of nodes to add to connect each node to the root, UNREACHABLE if it cannot be.
+
+    @allowed: The bitmask of the nodes the paths can use.
+    """
+    distances = [UNREACHABLE] * len(HOTM_TAKEN)
+    layer = [ENDPOINT]
+    distance = 0
+    while len(layer) > 0:
+        next_layer = []
+        for i in layer:
+            if distances[i] == UNREACHABLE:
+                distances[i] = distance
+                next_layer.extend(j for j in NEIGHBORS[i] if allowed >> j & 1)
+        layer = next_layer
+        distance += 1
+    return distances
+
+
+def get_steiner_costs(terminals: int, allowed: int, limit: int) -> int:
+    """
+    Get the least node counts of the trees connecting the terminals to each node, packed by bit index.
+
+    This is the Dreyfus-Wagner dynamic programming over the subsets of the terminals,
+    where each subset is split in two at the node its trees branch from.
+    Every tree is later connected to the root, so the nodes that cannot be connected
+    to both within the limit get the UNREACHABLE count, and so do all the nodes
+    if a subset of the terminals cannot be connected at all.
+
+    @terminals: The bitmask of the nodes to connect.
+    @allowed: The bitmask of the nodes the trees can use.
+    @limit: The most nodes of a tree, which must be less than UNREACHABLE.
+    """
+    key = (allowed, limit)
+    table = STEINER_COSTS.get(key)
+    if table is None:
+        table = STEINER_COSTS[key] = {}
+        if len(STEINER_COSTS) > STEINER_TABLES:
+            STEINER_COSTS.popitem(last=False)
+    else:
+        STEINER_COSTS.move_to_end(key)
+    if terminals in table:
+        return table[terminals]
+    distances = get_root_distances(allowed)
+
+    # The subsets are filled in from the smallest so that both parts of a split are known
+    subsets = []
+    sub = terminals
+    while sub:
+        if sub not in table:
+            subsets.append(sub)
+        sub = (sub - 1) & terminals
+    subsets.sort(key=int.bit_count)
+
+    for subset in subsets:
+        if subset & (subset - 1) == 0:
+            costs = [UNREACHABLE] * len(HOTM_TAKEN)
+            costs[subset.bit_length() - 1] = 1
+        else:
+            # Every split is listed once as the part with the lowest terminal
+            low = subset & -subset
+            rest = subset ^ low
+            best = LANES_UNREACHABLE * 2
+            part = rest
+            while part:
+                part = (part - 1) & rest
+                costs1 = table[part | low]
+                costs2 = table[rest ^ part]
+                # No tree with more terminals fits if a part of them does not fit
+                if costs1 == LANES_UNREACHABLE or costs2 == LANES_UNREACHABLE:
+                    best = LANES_UNREACHABLE + LANES_ONE
+                    break
+                merged = costs1 + costs2
+                # The high bit of a lane stays if the lane of best is no less than merged,
+                # which is turned into the low 7 bits that hold the lane value to take merged
+                keep = ((best | LANES_HIGH) - merged) & LANES_HIGH
+                keep -= keep >> 7
+                best ^= (best ^ merged) & keep
+            # The branching node is counted by both parts
+            costs = [*(best - LANES_ONE).to_bytes(len(HOTM_TAKEN), "little")]
+        for i, distance in enumerate(distances):
+            if costs[i] + distance > limit:
+                costs[i] = UNREACHABLE
+
+        # Extend the trees to the other nodes by the shortest paths
+        layers = [[] for _ in range(limit + 1)]
+        for i, cost in enumerate(costs):
+            if cost <= limit:
+                layers[cost].append(i)
+        for cost in range(1, limit):
+            for i in layers[cost]:
+                if costs[i] != cost:
+                    continue
+                for j in NEIGHBORS[i]:
+                    if cost + 1 < costs[j] and cost + 1 + distances[j] <= limit:
+                        costs[j] = cost + 1
+                        layers[cost + 1].append(j)
+        table[subset] = int.from_bytes(bytes(costs), "little")
+    return table[terminals]
+
+
+@lru_cache(maxsize=STEINER_TREES)
+def get_steiner_trees(terminals: int, node: int, allowed: int, limit: int) -> frozenset[int]:
+    """
+    Get the masks of all the trees with the least nodes connecting the terminals to the node.
+
+    The trees are rebuilt from every step of the dynamic programming that reaches the least count.
+
+    @terminals: The bitmask of the nodes to connect.
+    @node: The bit index of the node to connect the terminals to.
+    @allowed: The bitmask of the nodes the trees can use.
+    @limit: The most nodes of a tree, which must be less than UNREACHABLE.
+    """
+    bit = 1 << node
+    if terminals == bit:
+        return frozenset((bit,))
+    costs = get_steiner_costs(terminals, allowed, limit)
+    cost = get_lane(costs, node)
+    if cost == UNREACHABLE:
+        return frozenset()
+
+    trees = {*()}
+    for j in NEIGHBORS[node]:
+        if get_lane(costs, j) + 1 == cost:
+            trees.update(tree | bit for tree in get_steiner_trees(terminals, j, allowed, limit))
+    low = terminals & -terminals
+    rest = terminals ^ low
+    part = rest
+    while part:
+        part = (part - 1) & rest
+        sub = part | low
+        if get_lane(get_steiner_costs(sub, allowed, limit), node) + \
+                get_lane(get_steiner_costs(terminals ^ sub, allowed, limit), node) - 1 == cost:
+            for tree in get_steiner_trees(sub, node, allowed, limit):
+                trees.update(tree | other for other in
+                             get_steiner_trees(terminals ^ sub, node, allowed, limit))
+    return frozenset(trees)
+
+
+@timed("steiner_pathfind")
+def steiner_pathfind(terminals: int, hotm: int, tokens: int) -> list[int]:
+    """
+    Finds the masks of the valid HotM trees with the fewest tokens for a given mask of desired nodes.
+    """
+    # Add the Core of the Mountain, which is only unlocked from HOTM 5 and costs no token
+    if hotm > 4:
+        terminals |= 1 << CORE_OF_THE_MOUNTAIN
+        tokens += 1
+    allowed = get_rows_mask(hotm)
+    if terminals & allowed != terminals:
         return []
 
-    choice_groups = []
-    for node in nodes:
-        paths = PATHS.get(node, [])
-        valid_paths = [path for path in paths if all(
-            n[0] < hotm for n in path)]
+    # The root node is always taken, so the tree always connects to it
+    root = ENDPOINT
+    terminals &= ~(1 << ENDPOINT)
+    if terminals == 0:
+        return [1 << ENDPOINT] if tokens >= 1 else []
+    # No tree can have more nodes than the whole HOTM tree
+    limit = min(tokens, len(HOTM_TAKEN))
+    if get_lane(get_steiner_costs(terminals, allowed, limit), root) > limit:
+        return []
+    return sorted(get_steiner_trees(terminals, root, allowed, limit))
+
+
+@timed("union_pathfind")
+def union_pathfind(terminals: int, hotm: int, tokens: int) -> list[int]:
+    """
+    Finds the masks of all valid HotM trees for a given mask of desired nodes.
+
+    Every union of paths to the root that no other union is a subset of is kept,
+    so the trees can use more tokens than the fewest that steiner_pathfind finds.
+    """
+    rows_mask = get_rows_mask(hotm)
+
+    # The root node is always taken, so the tree always connects to it
+    choice_groups = [get_paths(ENDPOINT)]
+    for node in to_ids(terminals):
+        paths = get_paths(node)
+        valid_paths = [path for path in paths if path & rows_mask == path]
         if not valid_paths:  # If a required node has no valid path, no solution is possible
             return []
         choice_groups.append(valid_paths)
 
-    # Add paths for the Core of the Mountain
-    cotm_paths = [path for path in PATHS.get(
-        (4, 3), []) if all(n[0] < hotm for n in path)]
+    # Add paths for the Core of the Mountain, which is only unlocked from HOTM 5
+    if hotm > 4:
+        cotm_paths = [path for path in get_paths(CORE_OF_THE_MOUNTAIN)
+                      if path & rows_mask == path]
+        choice_groups.append(cotm_paths)
 
     # Token cost for CotM is 0, so we check paths up to tokens+1 and add CotM manually
     # The smart_union function will find all minimal combinations
-    choices = smart_union(*choice_groups, cotm_paths, max_len=tokens + 1)
+    with instrument.phase("smart_union"):
+        choices = smart_union(*choice_groups, max_len=tokens + 1)
 
     # Ensure CotM is in every final path and remove it from the token count check
     final_choices = []
     for path in choices:
-        final_path = path | {(4, 3)}
-        # The true cost is the length of the set minus the free CotM node
-        if len(final_path) - 1 <= tokens:
-            final_choices.append(final_path)
+        if hotm > 4:
+            final_path = path | 1 << CORE_OF_THE_MOUNTAIN
+            # The true cost is the number of nodes minus the free CotM node
+            if final_path.bit_count() - 1 <= tokens:
+                final_choices.append(final_path)
+        elif path.bit_count() <= tokens:
+            final_choices.append(path)
 
     return final_choices
 
@@ -115,16 +421,24 @@ def to_set_pos(nodes: set[str]):
     return {to_pos(node) for node in nodes}
 
 
-def find_trees(abilities, nodes, hotm, tokens):
-    all_trees = []
-    for ability in abilities:
-        required_nodes = to_set_pos(nodes | {ability})
-
-        tree_paths = union_pathfind(required_nodes, hotm, tokens)
-
-        if not tree_paths:
-            continue
+@timed("pathfind")
+def find_trees(abilities, nodes, hotm, tokens, fewest: bool = True) -> list[set[int]]:
+    """
+    Finds the node IDs of all minimal trees including the given nodes and one of the abilities.
 
-        all_trees.extend(tree_paths)
+    @abilities: The ability node IDs to try, None for a tree without an ability.
+    @nodes: The set of node IDs required in every tree.
+    @hotm: The HOTM level limiting the rows that can be used.
+    @tokens: The number of tokens available to the tree.
+    @fewest: Whether to only find the trees with the fewest tokens with the Steiner tree search
+        instead of every minimal union of the paths.
+    """
+    pathfind = steiner_pathfind if fewest else union_pathfind
+    all_trees = {*()}
+    required = to_mask(nodes)
+    for ability in abilities:
+        terminals = required if ability is None else required | 1 << ability
+        all_trees.update(pathfind(terminals, hotm, tokens))
 
-    return [set(t) for t in {tuple(sorted(list(tree))) for tree in all_trees}]
+    instrument.count("trees_found", len(all_trees))
+    return [to_ids(tree) for tree in sorted(all_trees)]
@@ -0,0 +1,85 @@
+from math import inf
+from typing import Iterable
+
+from data import *
+from strings import snake_to_title
+from optimizer import OptimizeResult
+
+
+def print_tree(names: list[str], max_hotm: int = 10):
+    for i, row in enumerate(HOTM_TREE[max_hotm-1::-1]):
+        hi = max_hotm - 1 - i
+        print(''.join('C' if (hi, pi) == (
+            4, 3) else '1' if perk in names else '0' if perk is not None else ' ' for pi, perk in enumerate(row)))
+
+
+def print_tree_coords(nodes: Iterable[int], max_hotm: int = 10):
+    pairs = {HOTM_TAKEN[node] for node in nodes}
+    for ri in range(max_hotm - 1, -1, -1):
+        for ci in range(7):
+            if HOTM_TREE[ri][ci] is None:
+                print(' ', end='')
+                continue
+            if (ri, ci) == (4, 3):
+                print('C', end='')
+            elif (ri, ci) in pairs:
+                print('1', end='')
+            else:
+                print('0', end='')
+        print()
+
+
+def format_duration(seconds: int) -> str:
+    """
+    Format a duration like 1h 02m 03s, leaving out the zero leading units.
+
+    @seconds: The duration in whole seconds.
+    """
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours > 0:
+        return f"{hours}h {minutes:02}m {seconds:02}s"
+    elif minutes > 0:
+        return f"{minutes}m {seconds:02}s"
+    return f"{seconds}s"
+
+
+def print_result(result: OptimizeResult):
+    """
+    Print the result of Optimizer.optimize as the tree, the levels, the efficiency,
+    the powder left and the time to the target amount.
+
+    @result: The result to print.
+    """
+    print(f"Relevant Stats: {result.stats_used}")
+    print(f"Significant Nodes: {[NODE_NAMES[node] for node in result.sig_nodes]}")
+    print(f"Optimizable Nodes: {[NODE_NAMES[node] for node in result.opti_nodes]}")
+
+    print('\n')
+    print('-' * 20 + " Tree Used " + '-' * 20)
+    print_tree_coords(result.tree)
+    print('-' * 20 + " Results " + '-' * 20)
+    # The node IDs are in the order of NODE_NAMES
+    for node, level in sorted(result.levels.items()):
+        if node in result.opti_nodes:
+            print(f" - {snake_to_title(NODE_NAMES[node])}: {level}")
+    mode_str = snake_to_title(result.unit)
+    print(f"Optimized Efficiency: {result.score:.2f} {mode_str} per minute.\n"
+          f"                    : {result.score_per_hour:.2f} {mode_str} per hour.")
+    if result.greedy_score is not None:
+        gap = ""
+        # A zero optimum has no gap to give as a percentage
+        if result.score != 0:
+            percent = (result.score - result.greedy_score) / result.score * 100
+            gap = f", {percent:.4f}% below the optimum"
+        print(f"Greedy Efficiency: {result.greedy_score:.2f} {mode_str} per minute{gap}.")
+    print('-' * 20 + " Powder Left " + '-' * 20)
+    print(f" - Mithril Powder: {result.powder_left['mithril']}")
+    print(f" - Gemstone Powder: {result.powder_left['gemstone']}")
+    print(f" - Glacite Powder: {result.powder_left['glacite']}")
+    if result.time_to_target is not None:
+        print('-' * 20 + " Time Estimation " + '-' * 20)
+        if result.time_to_target == inf:
+            print(f" - Never, at zero {mode_str} per minute")
+        else:
+            print(f" - {format_duration(result.time_to_target)}")
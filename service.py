@@ -0,0 +1,235 @@
+from argparse import ArgumentParser
+from asyncio import IncompleteReadError, get_running_loop, run, shield, start_server, wait_for
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from json import dumps, loads
+from math import inf
+from os import cpu_count
+
+from batch import optimize_config, to_config
+from cache import get_key
+from optimizer import Optimizer
+
+
+# The options of the allocation that a request can set
+OPTIONS = ("lazy", "bulk", "exact")
+MAX_BODY_BYTES = 1 << 20
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class OptimizeService:
+    """
+    HTTP service answering optimize requests with the tables kept loaded in a process pool.
+
+    The requests with the same fingerprint as one still being optimized wait for its result
+    instead of being optimized again, so the config fields unused by the mode and ore and
+    the field order never cause a second optimization.
+
+    POST /optimize takes the config fields on top of the config_init.py defaults as "config",
+    and optionally the lazy, bulk or exact options, and answers the result of batch.py.
+    GET /stats answers the request counts.
+    """
+
+    def __init__(self, workers: int | None = None, timeout: float | None = None):
+        """
+        @workers: Number of worker processes, defaults to the CPU count.
+        @timeout: Seconds to wait for a request to be read, no limit if None.
+        """
+        self.workers = workers or cpu_count() or 1
+        self.timeout = timeout
+        self.executor = None
+        # The futures of the results being optimized by their fingerprints
+        self.pending = {}
+        self.requests = 0
+        self.optimizations = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765):
+        """
+        Start the worker processes and listen, and return the server.
+
+        @host: The address to listen on, only the local machine by default.
+        @port: The port to listen on, or 0 for any free port.
+        """
+        self.executor = ProcessPoolExecutor(self.workers)
+        loop = get_running_loop()
+        # Start every worker now, so no request waits for one to start,
+        # and each one has the data tables loaded on import by this process
+        for _ in range(self.workers):
+            await loop.run_in_executor(self.executor, int)
+        return await start_server(self.handle, host, port)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    async def optimize(self, body: dict) -> dict:
+        """
+        Optimize the config of a request, or wait for the same one already being optimized.
+
+        @body: The JSON object of the request.
+        """
+        if not isinstance(body, dict):
+            raise HTTPError(400, "request body must be a JSON object")
+        unknown = [key for key in body if key not in ("config", *OPTIONS)]
+        if len(unknown) > 0:
+            raise HTTPError(400, f"unknown request fields: {unknown}")
+        options = {option: body.get(option, False) for option in OPTIONS}
+        if not all(isinstance(value, bool) for value in options.values()):
+            raise HTTPError(400, f"options must be booleans: {options}")
+        if options["lazy"] and options["bulk"]:
+            raise HTTPError(400, "lazy and bulk purchases cannot be used together")
+        record = body.get("config", {})
+        if not isinstance(record, dict):
+            raise HTTPError(400, "config must be a JSON object")
+        try:
+            config = to_config(record)
+            optimizer = Optimizer(config)
+            key = get_key(optimizer.get_fingerprint(
+                None, tuple(options[option] for option in OPTIONS)))
+        except (KeyError, ValueError, TypeError) as error:
+            raise HTTPError(400, f"{type(error).__name__}: {error}")
+
+        if key in self.pending:
+            self.coalesced += 1
+        else:
+            loop = get_running_loop()
+            future = loop.run_in_executor(
+                self.executor, partial(optimize_config, config, **options))
+            self.pending[key] = future
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+            self.optimizations += 1
+        # A closed connection stops waiting without cancelling the result of the others
+        result = await shield(self.pending[key])
+        # The target is not in the fingerprint, so each request finds its own time to it
+        time_to_target = optimizer.profile.get_time_to_target(result["score"])
+        # JSON has no inf, so a target that is never reached has no time
+        return {**result, "time_to_target": None if time_to_target == inf else time_to_target}
+
+    def get_stats(self) -> dict:
+        return {"requests": self.requests, "optimizations": self.optimizations,
+                "coalesced": self.coalesced, "errors": self.errors,
+                "pending": len(self.pending), "workers": self.workers}
+
+    async def route(self, method: str, path: str, body: bytes) -> dict:
+        path = path.split("?", 1)[0]
+        if path == "/optimize":
+            if method != "POST":
+                raise HTTPError(405, "use POST for /optimize")
+            try:
+                request = loads(body or b"{}")
+            except ValueError as error:
+                raise HTTPError(400, f"invalid JSON: {error}")
+            return await self.optimize(request)
+        elif path == "/stats":
+            if method != "GET":
+                raise HTTPError(405, "use GET for /stats")
+            return self.get_stats()
+        raise HTTPError(404, f"unknown path: {path}")
+
+    async def read_request(self, reader) -> tuple[str, str, dict[str, str], bytes] | None:
+        """
+        Read a request from the connection, or None if it is closed before one.
+
+        @reader: The stream of the connection.
+        """
+        try:
+            head = await wait_for(reader.readuntil(b"\r\n\r\n"), self.timeout)
+        except IncompleteReadError:
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, path, version = lines[0].split(" ")
+        except ValueError:
+            raise HTTPError(400, f"invalid request line: {lines[0]!r}")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, f"invalid content length: {headers['content-length']!r}")
+        if length < 0:
+            raise HTTPError(400, f"negative content length: {length}")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"request body over {MAX_BODY_BYTES} bytes")
+        body = await wait_for(reader.readexactly(length), self.timeout) if length > 0 else b""
+        return method, path, {**headers, "version": version}, body
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    self.requests += 1
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection == "keep-alive" or (
+                        headers["version"] == "HTTP/1.1" and connection != "close")
+                    status, response = 200, await self.route(method, path, body)
+                except HTTPError as error:
+                    self.errors += 1
+                    status, response = error.status, {"error": str(error)}
+                except (ConnectionError, TimeoutError):
+                    break
+                except Exception as error:  # A failed optimization is answered, not raised
+                    self.errors += 1
+                    status, response = 500, {"error": f"{type(error).__name__}: {error}"}
+                data = dumps(response).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                             f"\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host: str, port: int, workers: int | None):
+    service = OptimizeService(workers, timeout=30)
+    try:
+        server = await service.start(host, port)
+        for socket in server.sockets:
+            print(f"Serving on http://{socket.getsockname()[0]}:{socket.getsockname()[1]}",
+                  flush=True)
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main():
+    parser = ArgumentParser(description="Answer optimize requests over HTTP with JSON,"
+                                        " keeping the tables loaded between requests.")
+    parser.add_argument("--host", default="127.0.0.1", help="the address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=8765,
+                        help="the port to listen on, or 0 for any free port")
+    parser.add_argument("-w", "--workers", type=int, help="the number of worker processes")
+    args = parser.parse_args()
+    try:
+        run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()